@@ -5,9 +5,10 @@ import idaapi
 import HexRaysPyTools.core.cache as cache
 import HexRaysPyTools.core.const as const
 import HexRaysPyTools.settings as settings
-from HexRaysPyTools.callbacks import hx_callback_manager, action_manager
+from HexRaysPyTools.callbacks import hx_callback_manager, idb_callback_manager, idp_callback_manager, action_manager
+from HexRaysPyTools.core.cfunc_cache import cfunc_cache
 from HexRaysPyTools.core.struct_xrefs import XrefStorage
-from HexRaysPyTools.core.temporary_structure import TemporaryStructureModel
+from HexRaysPyTools.core.structure_registry import structure_registry
 
 
 class MyPlugin(idaapi.plugin_t):
@@ -25,7 +26,9 @@ class MyPlugin(idaapi.plugin_t):
 
         action_manager.initialize()
         hx_callback_manager.initialize()
-        cache.temporary_structure = TemporaryStructureModel()
+        idb_callback_manager.initialize()
+        idp_callback_manager.initialize()
+        structure_registry.clear()
         const.init()
         XrefStorage().open()
         return idaapi.PLUGIN_KEEP
@@ -38,7 +41,11 @@ class MyPlugin(idaapi.plugin_t):
     def term():
         action_manager.finalize()
         hx_callback_manager.finalize()
+        idb_callback_manager.finalize()
+        idp_callback_manager.finalize()
         XrefStorage().close()
+        # Decompiled functions must be released before Hex-Rays is terminated
+        cfunc_cache.clear()
         idaapi.term_hexrays_plugin()
 
 
@@ -1,8 +1,13 @@
 import logging
+import time
 import idaapi
 import idc
 from .core.helper import to_hex
 from .core import helper
+from .core.call_graph import call_graph
+from .core.cfunc_cache import cfunc_cache, internal_decompilation
+from .core.work_queue import WorkQueue
+import HexRaysPyTools.settings as settings
 
 logger = logging.getLogger(__name__)
 
@@ -415,6 +420,12 @@ class RecursiveObjectVisitor(ObjectVisitor):
         self._debug_scan_tree = {}
         self.__debug_scan_tree_root = idc.get_name(self._cfunc.entry_ea)
         self.__debug_message = []
+        self.__skipped_by_depth = 0
+
+    @property
+    def visited(self):
+        """ (function address, argument index) of all callees scanned so far """
+        return frozenset(self._visited)
 
     def visit_expr(self, cexpr):
         return super(RecursiveObjectVisitor, self).visit_expr(cexpr)
@@ -439,10 +450,12 @@ class RecursiveObjectVisitor(ObjectVisitor):
         self.crippled = self.__is_func_crippled()
 
     def process(self):
-        self._start()
-        self._recursive_process()
-        self._finish()
+        with internal_decompilation:
+            self._start()
+            self._recursive_process()
+            self._finish()
         self.dump_scan_tree()
+        logger.debug("Decompilation cache: {}".format(cfunc_cache))
 
     def dump_scan_tree(self):
         self.__prepare_debug_message()
@@ -463,6 +476,51 @@ class RecursiveObjectVisitor(ObjectVisitor):
         super(RecursiveObjectVisitor, self).process()
         self._finish_iteration()
 
+    def _process_new_for_visit(self):
+        """
+        Visits functions added by `_add_visit` in order of call distance from the current function until either
+        `SCAN_MAX_DEPTH`, `SCAN_MAX_FUNCTIONS` or `SCAN_TIME_LIMIT` is exceeded or user cancels the scan.
+        """
+        queue = WorkQueue("Deep scanning", describe=lambda item: idaapi.get_short_name(item[0]))
+        self.__schedule_new_for_visit(queue, 1)
+        start_time = time.time()
+        stop_reason = []
+
+        def visit(item):
+            if settings.SCAN_MAX_FUNCTIONS and queue.processed >= settings.SCAN_MAX_FUNCTIONS:
+                stop_reason.append("limit of {} functions".format(settings.SCAN_MAX_FUNCTIONS))
+                return False
+            if settings.SCAN_TIME_LIMIT and time.time() - start_time > settings.SCAN_TIME_LIMIT:
+                stop_reason.append("time limit of {} seconds".format(settings.SCAN_TIME_LIMIT))
+                return False
+            func_ea, arg_idx, depth = item
+            self._visit_new(func_ea, arg_idx)
+            self.__schedule_new_for_visit(queue, depth + 1)
+
+        if not queue.run(visit):
+            if queue.cancelled:
+                stop_reason.append("user")
+            # Item on which limit was hit is taken from the queue but not visited
+            not_visited = len(queue) + (0 if queue.cancelled else 1)
+            logger.warning("Deep scan was stopped by {} after visiting {} functions, {} are not visited".format(
+                stop_reason[0], queue.processed, not_visited))
+        if self.__skipped_by_depth:
+            logger.warning("{} functions deeper than {} calls from the scanned one are not visited".format(
+                self.__skipped_by_depth, settings.SCAN_MAX_DEPTH))
+            self.__skipped_by_depth = 0
+
+    def _visit_new(self, func_ea, arg_idx):
+        """ Scans function or its callers added by `_add_visit` """
+        raise NotImplementedError
+
+    def __schedule_new_for_visit(self, queue, depth):
+        for func_ea, arg_idx in sorted(self._new_for_visit):
+            if settings.SCAN_MAX_DEPTH and depth > settings.SCAN_MAX_DEPTH:
+                self.__skipped_by_depth += 1
+            else:
+                queue.push((func_ea, arg_idx, depth))
+        self._new_for_visit.clear()
+
     def _manipulate(self, cexpr, obj):
         self._check_call(cexpr)
         super(RecursiveObjectVisitor, self)._manipulate(cexpr, obj)
@@ -534,17 +592,17 @@ class RecursiveObjectDownwardsVisitor(RecursiveObjectVisitor, ObjectDownwardsVis
 
     def _recursive_process(self):
         super(RecursiveObjectDownwardsVisitor, self)._recursive_process()
+        self._process_new_for_visit()
 
-        while self._new_for_visit:
-            func_ea, arg_idx = self._new_for_visit.pop()
-            if helper.is_imported_ea(func_ea):
-                continue
-            cfunc = helper.decompile_function(func_ea)
-            if cfunc:
-                assert arg_idx < len(cfunc.get_lvars()), "Wrong argument at func {}".format(to_hex(func_ea))
-                obj = VariableObject(cfunc.get_lvars()[arg_idx], arg_idx)
-                self.prepare_new_scan(cfunc, arg_idx, obj)
-                self._recursive_process()
+    def _visit_new(self, func_ea, arg_idx):
+        if helper.is_imported_ea(func_ea):
+            return
+        cfunc = helper.decompile_function(func_ea)
+        if cfunc:
+            assert arg_idx < len(cfunc.get_lvars()), "Wrong argument at func {}".format(to_hex(func_ea))
+            obj = VariableObject(cfunc.get_lvars()[arg_idx], arg_idx)
+            self.prepare_new_scan(cfunc, arg_idx, obj)
+            super(RecursiveObjectDownwardsVisitor, self)._recursive_process()
 
 
 class RecursiveObjectUpwardsVisitor(RecursiveObjectVisitor, ObjectUpwardsVisitor):
@@ -560,20 +618,18 @@ class RecursiveObjectUpwardsVisitor(RecursiveObjectVisitor, ObjectUpwardsVisitor
             func_ea = self._cfunc.entry_ea
             arg_idx = cexpr.v.idx
             if self._add_visit(func_ea, arg_idx):
-                for callee_ea in helper.get_funcs_calling_address(func_ea):
+                for callee_ea in call_graph.get_callers(func_ea):
                     self._add_scan_tree_info(callee_ea, arg_idx)
 
     def _recursive_process(self):
         super(RecursiveObjectUpwardsVisitor, self)._recursive_process()
+        self._process_new_for_visit()
 
-        while self._new_for_visit:
-            new_visit = list(self._new_for_visit)
-            self._new_for_visit.clear()
-            for func_ea, arg_idx in new_visit:
-                funcs = helper.get_funcs_calling_address(func_ea)
-                obj = CallArgObject.create(idaapi.decompile(func_ea), arg_idx)
-                for callee_ea in funcs:
-                    cfunc = helper.decompile_function(callee_ea)
-                    if cfunc:
-                        self.prepare_new_scan(cfunc, arg_idx, obj, False)
-                        super(RecursiveObjectUpwardsVisitor, self)._recursive_process()
+    def _visit_new(self, func_ea, arg_idx):
+        funcs = call_graph.get_callers(func_ea)
+        obj = CallArgObject.create(helper.decompile_function(func_ea), arg_idx)
+        for callee_ea in funcs:
+            cfunc = helper.decompile_function(callee_ea)
+            if cfunc:
+                self.prepare_new_scan(cfunc, arg_idx, obj, False)
+                super(RecursiveObjectUpwardsVisitor, self)._recursive_process()
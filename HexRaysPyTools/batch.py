@@ -0,0 +1,147 @@
+"""
+Structure reconstruction without user interface. Can be used from IDAPython scripts:
+
+    from HexRaysPyTools import batch
+    batch.initialize()
+    print(batch.reconstruct_structure([(0x401000, 0), (0x402000, 1)], name="Foo"))
+
+or as a script for IDA running in batch mode:
+
+    idat -A -S"path/to/HexRaysPyTools/batch.py [-n NAME] [-o OUTPUT] [-i] [--infer] [FUNCTION:ARG ...]" database
+
+FUNCTION is either address or name of a function, ARG is index of its argument which is scanned. With --infer seeds are
+split into groups of the same type and a structure is created for every group, if no seeds are given first arguments
+of all functions are used. Unlike Structure Builder, types of scanned variables are not changed even if created
+structures are imported to Local Types.
+"""
+import argparse
+import logging
+
+import idaapi
+import idc
+
+import HexRaysPyTools.core.cache as cache
+import HexRaysPyTools.core.const as const
+import HexRaysPyTools.core.structure_inference as structure_inference
+from HexRaysPyTools.core.temporary_structure import TemporaryStructure
+
+logger = logging.getLogger(__name__)
+
+
+def initialize():
+    """ Does the same preparations as the plugin. Must be called once after database is loaded """
+    if not idaapi.init_hexrays_plugin():
+        raise RuntimeError("Failed to initialize Hex-Rays SDK")
+    const.init()
+    cache.initialize_cache()
+
+
+def scan_seeds(seeds, structure=None):
+    """
+    Deep scans given arguments of functions and collects found members.
+
+    :param seeds: iterable of (function address, argument index)
+    :param structure: TemporaryStructure to which members are added, new one is created if not given
+    :return: TemporaryStructure
+    """
+    if structure is None:
+        structure = TemporaryStructure()
+
+    for func_ea, arg_idx in seeds:
+        structure_inference.scan_seed(func_ea, arg_idx, structure)
+    return structure
+
+
+def reconstruct_structure(seeds, name=None, import_type=False):
+    """
+    Scans seeds, resolves conflicting members and returns C declaration of the structure or None if nothing is found.
+
+    :param seeds: iterable of (function address, argument index)
+    :param name: name of the structure. By default it's taken from virtual table or set to default
+    :param import_type: whether to add the structure to Local Types, existing type with the same name is replaced
+    :return: str
+    """
+    structure = scan_seeds(seeds)
+    if not structure.items:
+        return None
+    structure.resolve_types()
+    cdecl = structure.get_declaration(name=name)
+    if cdecl and import_type:
+        structure.import_declaration(cdecl, ask=False)
+    return cdecl
+
+
+def infer_structures(seeds=None, import_types=False):
+    """
+    Infers several structures at once, merging members of seeds that are found to have the same type.
+
+    :param seeds: iterable of (function address, argument index). By default first arguments of all functions
+    :param import_types: whether to add structures to Local Types, existing types with the same names are replaced
+    :return: list of C declarations
+    """
+    if seeds is None:
+        seeds = structure_inference.get_first_argument_seeds()
+    result = []
+    for inferred in structure_inference.infer_structures(list(seeds)):
+        inferred.structure.resolve_types()
+        cdecl = inferred.structure.get_declaration(name=inferred.name)
+        if not cdecl:
+            continue
+        if import_types:
+            inferred.structure.import_declaration(cdecl, ask=False)
+        result.append(cdecl)
+    return result
+
+
+def _parse_seed(seed):
+    function, _, arg_idx = seed.rpartition(':')
+    try:
+        func_ea = int(function, 0)
+    except ValueError:
+        func_ea = idc.get_name_ea_simple(function)
+    if func_ea == idaapi.BADADDR or not idaapi.get_func(func_ea):
+        raise argparse.ArgumentTypeError("Function {} is not found".format(function))
+    return idaapi.get_func(func_ea).start_ea, int(arg_idx)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconstructs structure by deep scanning arguments of functions")
+    parser.add_argument("seeds", nargs="*", type=_parse_seed, help="FUNCTION:ARG, function address or name and index "
+                                                                   "of its argument")
+    parser.add_argument("-n", "--name", help="name of the structure")
+    parser.add_argument("-o", "--output", help="file where declaration is written, printed if not set")
+    parser.add_argument("-i", "--import-type", action="store_true", help="add structure to Local Types")
+    parser.add_argument("--infer", action="store_true", help="infer separate structures for seeds of different types, "
+                                                             "first arguments of all functions if no seeds are given")
+
+    status = 1
+    try:
+        idaapi.auto_wait()
+        args = parser.parse_args(idc.ARGV[1:])
+        if not args.seeds and not args.infer:
+            parser.error("seeds are required unless --infer is set")
+        initialize()
+        if args.infer:
+            cdecl = "\n\n".join(infer_structures(args.seeds or None, args.import_type))
+        else:
+            cdecl = reconstruct_structure(args.seeds, args.name, args.import_type)
+        if cdecl:
+            if args.output:
+                with open(args.output, "w") as f:
+                    f.write(cdecl)
+            else:
+                print(cdecl)
+            status = 0
+        else:
+            print("[Error] Failed to reconstruct structure")
+    except SystemExit as e:
+        # Raised by argparse on wrong arguments, IDA is closed below anyway
+        status = e.code
+    except Exception:
+        logger.exception("Failed to reconstruct structure")
+    finally:
+        idc.qexit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 from .actions import *
 from .callbacks import *
+from . import cache_invalidation
+from . import callback_statistics
 from . import form_requests
 from . import function_signature_modifiers
 from . import guess_allocation
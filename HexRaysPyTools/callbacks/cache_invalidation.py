@@ -0,0 +1,91 @@
+import logging
+
+import idaapi
+
+from . import callbacks
+import HexRaysPyTools.core.type_library as type_library
+from HexRaysPyTools.core.call_graph import call_graph
+from HexRaysPyTools.core.cfunc_cache import cfunc_cache
+from HexRaysPyTools.core.type_shapes import type_shape_index
+
+logger = logging.getLogger(__name__)
+
+
+class CfuncCacheMaturityHandler(callbacks.HexRaysEventHandler):
+    """ Function is being decompiled again, so whatever is stored in cache is outdated """
+
+    def __init__(self):
+        super(CfuncCacheMaturityHandler, self).__init__()
+
+    def handle(self, event, *args):
+        cfunc = args[0]
+        cfunc_cache.invalidate(cfunc.entry_ea)
+
+
+class CfuncCacheIdbHandler(callbacks.IdbEventHandler):
+    def __init__(self):
+        super(CfuncCacheIdbHandler, self).__init__()
+
+    def handle(self, event, *args):
+        if event == "local_types_changed":
+            logger.debug("Local types have changed, clearing decompilation cache")
+            cfunc_cache.clear()
+        elif event == "ti_changed":
+            ea = args[0]
+            func = idaapi.get_func(ea)
+            if func and func.start_ea == ea:
+                # Prototype has changed, callers have to be decompiled again as well
+                cfunc_cache.invalidate(ea)
+                for caller_ea in call_graph.get_callers(ea):
+                    cfunc_cache.invalidate(caller_ea)
+        elif event in ("func_updated", "deleting_func"):
+            cfunc_cache.invalidate(args[0].start_ea)
+
+
+class CallGraphHandler(callbacks.IdbEventHandler):
+    def __init__(self):
+        super(CallGraphHandler, self).__init__()
+
+    def handle(self, event, *args):
+        call_graph.invalidate(args[0].start_ea)
+
+
+class CallGraphReferenceHandler(callbacks.IdpEventHandler):
+    """ Calls added or removed by user or scripts, e.g. resolved indirect calls """
+
+    def __init__(self):
+        super(CallGraphReferenceHandler, self).__init__()
+
+    def handle(self, event, *args):
+        from_ea, to_ea = args[0], args[1]
+        call_graph.invalidate_reference(from_ea, to_ea)
+
+
+class LocalTypesIndexHandler(callbacks.IdbEventHandler):
+    """ Drops or updates indices built over Local Types: shapes of structures, sizes and containment of types """
+
+    def __init__(self):
+        super(LocalTypesIndexHandler, self).__init__()
+
+    def handle(self, event, *args):
+        type_shape_index.invalidate()
+        type_library.invalidate_local_types()
+
+
+callbacks.hx_callback_manager.register(idaapi.hxe_maturity, CfuncCacheMaturityHandler(), idaapi.CMAT_BUILT)
+
+cfunc_cache_idb_handler = CfuncCacheIdbHandler()
+callbacks.idb_callback_manager.register("local_types_changed", cfunc_cache_idb_handler)
+callbacks.idb_callback_manager.register("ti_changed", cfunc_cache_idb_handler)
+callbacks.idb_callback_manager.register("func_updated", cfunc_cache_idb_handler)
+callbacks.idb_callback_manager.register("deleting_func", cfunc_cache_idb_handler)
+callbacks.idb_callback_manager.register("local_types_changed", LocalTypesIndexHandler())
+
+call_graph_handler = CallGraphHandler()
+callbacks.idb_callback_manager.register("func_added", call_graph_handler)
+callbacks.idb_callback_manager.register("func_updated", call_graph_handler)
+callbacks.idb_callback_manager.register("deleting_func", call_graph_handler)
+
+call_graph_reference_handler = CallGraphReferenceHandler()
+callbacks.idp_callback_manager.register("ev_add_cref", call_graph_reference_handler)
+callbacks.idp_callback_manager.register("ev_del_cref", call_graph_reference_handler)
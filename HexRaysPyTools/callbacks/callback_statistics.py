@@ -0,0 +1,40 @@
+import idaapi
+
+from . import actions
+from . import callbacks
+
+
+def _get_constant_names(prefix):
+    return dict((getattr(idaapi, name), name) for name in dir(idaapi) if name.startswith(prefix))
+
+
+class ShowCallbackStatistics(actions.Action):
+    description = "Show Hex-Rays callback statistics"
+
+    def __init__(self):
+        super(ShowCallbackStatistics, self).__init__()
+
+    def activate(self, ctx):
+        statistics = callbacks.hx_callback_manager.get_statistics()
+        if not statistics:
+            print("[Info] No Hex-Rays events have been handled yet")
+            return
+
+        event_names = _get_constant_names("hxe_")
+        maturity_names = _get_constant_names("CMAT_")
+        print("[Info] Time spent by handlers of Hex-Rays events:")
+        print("{:<60} {:<30} {:>8} {:>12} {:>10}".format("Handler", "Event", "Calls", "Total, ms", "Avg, ms"))
+        for name, event, level_of_maturity, calls, total_time in statistics:
+            event_name = event_names.get(event, str(event))
+            if level_of_maturity is not None:
+                event_name += ":" + maturity_names.get(level_of_maturity, str(level_of_maturity))
+            print("{:<60} {:<30} {:>8} {:>12.1f} {:>10.3f}".format(
+                name, event_name, calls, total_time * 1000, total_time * 1000 / calls))
+
+    def update(self, ctx):
+        return idaapi.AST_ENABLE_ALWAYS
+
+
+show_callback_statistics = ShowCallbackStatistics()
+actions.action_manager.register(show_callback_statistics)
+idaapi.attach_action_to_menu('Edit/Plugins/', show_callback_statistics.name, idaapi.SETMENU_APP)
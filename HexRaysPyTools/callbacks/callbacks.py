@@ -1,10 +1,18 @@
 from collections import defaultdict
+import time
+
 import idaapi
 
 
 class HexRaysCallbackManager(object):
+    """
+    Dispatches Hex-Rays events to registered handlers. Handlers of `hxe_maturity` can be registered for a specific
+    level of maturity, then they are called only at that level. Number of calls and time spent are counted for every
+    handler, so it's possible to tell how much the plugin adds to decompilation.
+    """
     def __init__(self):
-        self.__hexrays_event_handlers = defaultdict(list)
+        self.__hexrays_event_handlers = defaultdict(list)   # {(event, level of maturity or None): [handlers]}
+        self.__statistics = defaultdict(lambda: [0, 0.0])   # {(handler name, event, level of maturity): [calls, time]}
 
     def initialize(self):
         idaapi.install_hexrays_callback(self.__handle)
@@ -12,15 +20,39 @@ class HexRaysCallbackManager(object):
     def finalize(self):
         idaapi.remove_hexrays_callback(self.__handle)
 
-    def register(self, event, handler):
-        self.__hexrays_event_handlers[event].append(handler)
+    def register(self, event, handler, level_of_maturity=None):
+        self.__hexrays_event_handlers[(event, level_of_maturity)].append(handler)
+
+    def get_statistics(self):
+        """ Returns list of (handler name, event, level of maturity, calls, total time) sorted by total time """
+        result = [key + tuple(value) for key, value in self.__statistics.items()]
+        return sorted(result, key=lambda x: x[4], reverse=True)
+
+    def reset_statistics(self):
+        self.__statistics.clear()
 
     def __handle(self, event, *args):
-        for handler in self.__hexrays_event_handlers[event]:
-            handler.handle(event, *args)
+        handlers = self.__hexrays_event_handlers.get((event, None))
+        if handlers:
+            self.__call_handlers(handlers, event, None, args)
+        if event == idaapi.hxe_maturity:
+            level_of_maturity = args[1]
+            handlers = self.__hexrays_event_handlers.get((event, level_of_maturity))
+            if handlers:
+                self.__call_handlers(handlers, event, level_of_maturity, args)
         # IDA expects zero
         return 0
 
+    def __call_handlers(self, handlers, event, level_of_maturity, args):
+        for handler in handlers:
+            start_time = time.time()
+            try:
+                handler.handle(event, *args)
+            finally:
+                statistics = self.__statistics[(handler.name, event, level_of_maturity)]
+                statistics[0] += 1
+                statistics[1] += time.time() - start_time
+
 
 hx_callback_manager = HexRaysCallbackManager()
 
@@ -29,5 +61,100 @@ class HexRaysEventHandler(object):
     def __init__(self):
         super(HexRaysEventHandler, self).__init__()
 
+    @property
+    def name(self):
+        """ Used in statistics of callbacks """
+        return type(self).__name__
+
+    def handle(self, event, *args):
+        raise NotImplementedError("This is an abstract class")
+
+
+class IdbCallbackManager(idaapi.IDB_Hooks):
+    """
+    Same as HexRaysCallbackManager but for database events. Events are the names of IDB_Hooks methods, only those
+    that are needed by the plugin are forwarded.
+    """
+    def __init__(self):
+        super(IdbCallbackManager, self).__init__()
+        self.__idb_event_handlers = defaultdict(list)
+
+    def initialize(self):
+        self.hook()
+
+    def finalize(self):
+        self.unhook()
+
+    def register(self, event, handler):
+        self.__idb_event_handlers[event].append(handler)
+
+    def __handle(self, event, *args):
+        for handler in self.__idb_event_handlers[event]:
+            handler.handle(event, *args)
+        # IDA expects zero
+        return 0
+
+    def local_types_changed(self, *args):
+        return self.__handle("local_types_changed", *args)
+
+    def ti_changed(self, *args):
+        return self.__handle("ti_changed", *args)
+
+    def func_added(self, *args):
+        return self.__handle("func_added", *args)
+
+    def func_updated(self, *args):
+        return self.__handle("func_updated", *args)
+
+    def deleting_func(self, *args):
+        return self.__handle("deleting_func", *args)
+
+
+idb_callback_manager = IdbCallbackManager()
+
+
+class IdbEventHandler(object):
+    def __init__(self):
+        super(IdbEventHandler, self).__init__()
+
+    def handle(self, event, *args):
+        raise NotImplementedError("This is an abstract class")
+
+
+class IdpCallbackManager(idaapi.IDP_Hooks):
+    """ Same as IdbCallbackManager but for processor events, event is the name of IDP_Hooks method """
+    def __init__(self):
+        super(IdpCallbackManager, self).__init__()
+        self.__idp_event_handlers = defaultdict(list)
+
+    def initialize(self):
+        self.hook()
+
+    def finalize(self):
+        self.unhook()
+
+    def register(self, event, handler):
+        self.__idp_event_handlers[event].append(handler)
+
+    def __handle(self, event, *args):
+        for handler in self.__idp_event_handlers[event]:
+            handler.handle(event, *args)
+        # IDA expects zero
+        return 0
+
+    def ev_add_cref(self, *args):
+        return self.__handle("ev_add_cref", *args)
+
+    def ev_del_cref(self, *args):
+        return self.__handle("ev_del_cref", *args)
+
+
+idp_callback_manager = IdpCallbackManager()
+
+
+class IdpEventHandler(object):
+    def __init__(self):
+        super(IdpEventHandler, self).__init__()
+
     def handle(self, event, *args):
         raise NotImplementedError("This is an abstract class")
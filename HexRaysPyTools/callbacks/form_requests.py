@@ -1,9 +1,10 @@
 import idaapi
 
 from . import actions
-import HexRaysPyTools.core.cache as cache
 import HexRaysPyTools.core.classes as classes
 from HexRaysPyTools.core.structure_graph import StructureGraph
+from HexRaysPyTools.core.structure_registry import structure_registry
+from HexRaysPyTools.core.temporary_structure_model import TemporaryStructureModel
 from HexRaysPyTools.forms import StructureGraphViewer, ClassViewer, StructureBuilder
 
 
@@ -66,6 +67,7 @@ class ShowStructureBuilder(actions.HexRaysPopupAction):
 
     def __init__(self):
         super(ShowStructureBuilder, self).__init__()
+        self.structure_models = {}      # {name of structure in registry: TemporaryStructureModel}
 
     def check(self, hx_view):
         return True
@@ -75,7 +77,19 @@ class ShowStructureBuilder(actions.HexRaysPopupAction):
         if tform:
             idaapi.activate_widget(tform, True)
         else:
-            StructureBuilder(cache.temporary_structure).Show()
+            StructureBuilder(structure_registry, self.get_model).Show()
+
+    def get_model(self, name):
+        for stale_name in set(self.structure_models) - set(structure_registry.names()):
+            self.structure_models.pop(stale_name).detach()
+        structure = structure_registry.get(name)
+        model = self.structure_models.get(name)
+        if model is None or model.structure is not structure:
+            if model is not None:
+                model.detach()
+            model = TemporaryStructureModel(structure)
+            self.structure_models[name] = model
+        return model
 
     def update(self, ctx):
         return idaapi.AST_ENABLE_ALWAYS
@@ -0,0 +1,78 @@
+from collections import defaultdict
+import idaapi
+
+from . import callbacks
+
+
+class CtreeConsumer(object):
+    """
+    Analysis that is done during single traversal of ctree shared with other consumers. Only expressions with
+    operations listed in `expression_ops` are passed to it.
+    """
+    expression_ops = ()
+
+    def __init__(self):
+        super(CtreeConsumer, self).__init__()
+
+    def start(self, cfunc):
+        """ Called before traversal. Returns False if function isn't interesting, then consumer is skipped """
+        return True
+
+    def visit_expr(self, expression):
+        pass
+
+    def finish(self, cfunc):
+        """ Called after traversal, the only place where ctree may be modified """
+        pass
+
+
+class FusedCtreeVisitor(idaapi.ctree_visitor_t):
+    def __init__(self, consumers):
+        super(FusedCtreeVisitor, self).__init__(idaapi.CV_FAST)
+        self.__consumers = defaultdict(list)
+        for consumer in consumers:
+            for op in consumer.expression_ops:
+                self.__consumers[op].append(consumer)
+
+    def visit_expr(self, expression):
+        consumers = self.__consumers.get(expression.op)
+        if consumers:
+            for consumer in consumers:
+                consumer.visit_expr(expression)
+        return 0
+
+
+class _MaturityHandler(callbacks.HexRaysEventHandler):
+    def __init__(self):
+        super(_MaturityHandler, self).__init__()
+        self.consumers = []
+
+    @property
+    def name(self):
+        return "FusedCtreeVisitor({})".format(", ".join(type(consumer).__name__ for consumer in self.consumers))
+
+    def handle(self, event, *args):
+        cfunc = args[0]
+        consumers = [consumer for consumer in self.consumers if consumer.start(cfunc)]
+        if consumers:
+            FusedCtreeVisitor(consumers).apply_to(cfunc.body, None)
+            for consumer in consumers:
+                consumer.finish(cfunc)
+
+
+class FusedVisitorManager(object):
+    """ Runs all consumers registered for the same level of maturity in one traversal of ctree """
+
+    def __init__(self):
+        self.__handlers = {}
+
+    def register(self, level_of_maturity, consumer):
+        handler = self.__handlers.get(level_of_maturity)
+        if handler is None:
+            handler = _MaturityHandler()
+            self.__handlers[level_of_maturity] = handler
+            callbacks.hx_callback_manager.register(idaapi.hxe_maturity, handler, level_of_maturity)
+        handler.consumers.append(consumer)
+
+
+fused_visitor_manager = FusedVisitorManager()
@@ -3,10 +3,12 @@ import logging
 import idaapi
 
 from . import actions
-from . import callbacks
+from .fused_visitor import CtreeConsumer, fused_visitor_manager
 import HexRaysPyTools.core.helper as helper
 import HexRaysPyTools.core.type_library as type_library
 import HexRaysPyTools.forms as forms
+import HexRaysPyTools.settings as settings
+from HexRaysPyTools.core.cfunc_cache import internal_decompilation
 
 logger = logging.getLogger(__name__)
 potential_negatives = {}
@@ -15,11 +17,11 @@ potential_negatives = {}
 def _has_magic_comment(lvar):
     # type: (idaapi.lvar_t) -> bool
     # FIXME: Use internal IDA storage for CONTAINING_RECORD macro
-    return bool(re.search("```.*```", lvar.cmt))
+    return "```" in lvar.cmt and bool(re.search("```.*```", lvar.cmt))
 
 
 def _parse_magic_comment(lvar):
-    if lvar.type().is_ptr():
+    if "```" in lvar.cmt and lvar.type().is_ptr():
         m = re.search('```(.+)```', lvar.cmt)
         if m:
             structure_name, offset = m.group(1).split('+')
@@ -88,11 +90,11 @@ class NegativeLocalCandidate:
             return udt_member.offset == offset * 8
         return False
 
-    def find_containing_structures(self, type_library):
+    def find_containing_structures(self, library):
         """
         Given the type library creates a list of structures from this library, that contains this structure and
         satisfy offset conditions.
-        :param type_library: idaapi.til_t
+        :param library: idaapi.til_t
         :returns: ordinal, offset, member_name, containing structure name
         """
 
@@ -105,18 +107,14 @@ class NegativeLocalCandidate:
         # Least acceptable size of the containing structure
         min_struct_size = max_offset - min_offset
         result = []
-        parent_tinfo = idaapi.tinfo_t()
         target_tinfo = idaapi.tinfo_t()
-        if not target_tinfo.get_named_type(type_library, self.tinfo.dstr()):
-            print("[Warning] Such type doesn't exist in '{0}' library".format(type_library.name))
+        if not target_tinfo.get_named_type(library, self.tinfo.dstr()):
+            print("[Warning] Such type doesn't exist in '{0}' library".format(library.name))
             return result
-        for ordinal in range(1, idaapi.get_ordinal_qty(type_library)):
-            parent_tinfo.create_typedef(type_library, ordinal)
-            if parent_tinfo.get_size() >= min_struct_size:
-                for offset, name in find_deep_members(parent_tinfo, target_tinfo):
-                    # print "[DEBUG] Found {0} at {1} in {2}".format(name, offset, parent_tinfo.dstr())
-                    if offset + min_offset >= 0 and offset + max_offset <= parent_tinfo.get_size():
-                        result.append((ordinal, offset, name, parent_tinfo.dstr()))
+        containing_types = type_library.find_containing_types(library, target_tinfo)
+        for ordinal, offset, name, parent_name, parent_size in containing_types:
+            if parent_size >= min_struct_size and offset + min_offset >= 0 and offset + max_offset <= parent_size:
+                result.append((ordinal, offset, name, parent_name))
         return result
 
 
@@ -175,7 +173,7 @@ class ReplaceVisitor(idaapi.ctree_parentee_t):
         new_cexpr_call.a.push_back(arg_field)
         new_cexpr_call.thisown = False
 
-        parent = reversed(self.parents).next().cexpr
+        parent = next(reversed(self.parents)).cexpr
 
         diff = negative_lvar.offset + offset
         if diff:
@@ -205,113 +203,105 @@ class ReplaceVisitor(idaapi.ctree_parentee_t):
                 expression.assign(new_cexpr_call)
 
 
-class SearchVisitor(idaapi.ctree_parentee_t):
-    def __init__(self, cfunc):
-        super(SearchVisitor, self).__init__()
-        self.cfunc = cfunc
-        self.result = {}
+def _find_containing_record(expression):
+    """ Returns index of variable and NegativeLocalInfo if expression is CONTAINING_RECORD made by Ida """
+    if expression.x.op == idaapi.cot_helper and len(expression.a) == 3:
+        if expression.x.helper == "CONTAINING_RECORD":
+            if expression.a[0].op == idaapi.cot_var:
+                idx = expression.a[0].v.idx
+                if expression.a[1].op == idaapi.cot_helper and expression.a[2].op == idaapi.cot_helper:
+                    parent_name = expression.a[1].helper
+                    member_name = expression.a[2].helper
+                    parent_tinfo = idaapi.tinfo_t()
+                    if not parent_tinfo.get_named_type(idaapi.cvar.idati, parent_name):
+                        return None
+                    udt_data = idaapi.udt_type_data_t()
+                    parent_tinfo.get_udt_details(udt_data)
+                    udt_member = [x for x in udt_data if x.name == member_name]
+                    if udt_member:
+                        tinfo = udt_member[0].type
+                        return idx, NegativeLocalInfo(tinfo, parent_tinfo, udt_member[0].offset // 8, member_name)
+    return None
 
-    def visit_expr(self, expression):
-        if expression.op == idaapi.cot_call and expression.x.op == idaapi.cot_helper and len(expression.a) == 3:
-            if expression.x.helper == "CONTAINING_RECORD":
-                if expression.a[0].op == idaapi.cot_var:
-                    idx = expression.a[0].v.idx
-                    if expression.a[1].op == idaapi.cot_helper and expression.a[2].op == idaapi.cot_helper:
-                        parent_name = expression.a[1].helper
-                        member_name = expression.a[2].helper
-                        parent_tinfo = idaapi.tinfo_t()
-                        if not parent_tinfo.get_named_type(idaapi.cvar.idati, parent_name):
-                            return 0
-                        udt_data = idaapi.udt_type_data_t()
-                        parent_tinfo.get_udt_details(udt_data)
-                        udt_member = [x for x in udt_data if x.name == member_name]
-                        if udt_member:
-                            tinfo = udt_member[0].type
-                            self.result[idx] = NegativeLocalInfo(
-                                tinfo,
-                                parent_tinfo,
-                                udt_member[0].offset // 8,
-                                member_name
-                            )
-                            return 1
-        return 0
 
+class PotentialNegativeCollector(CtreeConsumer):
+    """
+    Collects variables that are already known to point to substructure (CONTAINING_RECORD made by Ida or saved in
+    comment) and structure pointers having references going beyond structure boundaries. The latter are considered as
+    potential pointers to substructure and get a special menu on right click. For the former CONTAINING_RECORD macro
+    is created.
+    """
+    expression_ops = (idaapi.cot_call, idaapi.cot_add, idaapi.cot_sub)
 
-class AnalyseVisitor(idaapi.ctree_parentee_t):
-    def __init__(self, candidates):
-        global potential_negatives
-        super(AnalyseVisitor, self).__init__()
-        self.candidates = candidates
-        self.potential_negatives = potential_negatives
-        self.potential_negatives.clear()
+    def __init__(self):
+        super(PotentialNegativeCollector, self).__init__()
+        self.__reset()
+
+    def __reset(self):
+        self.__negative_lvars = {}
+        self.__commented_lvars = {}
+        self.__structure_pointers = {}
+        self.__offsets = {}
+        self.__offset_lvars = set()
+
+    def start(self, cfunc):
+        # State is reset here too, in case processing of the previous function has failed before finishing
+        self.__reset()
+        if not settings.NEGATIVE_OFFSETS:
+            return False
+        # Potential negatives are needed only for the menu of the function user looks at. CONTAINING_RECORD macro
+        # is still created for functions decompiled by the plugin, because it changes what scanners see
+        analyse = not internal_decompilation.active
+        if analyse:
+            potential_negatives.clear()
+        lvars = cfunc.get_lvars()
+        for idx in range(len(lvars)):
+            result = _parse_magic_comment(lvars[idx])
+            if result and result.tinfo.equals_to(lvars[idx].type().get_pointed_object()):
+                self.__commented_lvars[idx] = result
+            elif analyse and lvars[idx].type().is_ptr():
+                pointed_tinfo = lvars[idx].type().get_pointed_object()
+                if pointed_tinfo.is_udt():
+                    self.__structure_pointers[idx] = pointed_tinfo
+        return True
 
     def visit_expr(self, expression):
-        if expression.op == idaapi.cot_add and expression.y.op == idaapi.cot_num:
-            if expression.x.op == idaapi.cot_var and expression.x.v.idx in self.candidates:
-                idx = expression.x.v.idx
-                number = expression.y.numval()
-                if self.candidates[idx].get_size() <= number:
-                    if idx in self.potential_negatives:
-                        self.potential_negatives[idx].offsets.append(number)
-                    else:
-                        self.potential_negatives[idx] = NegativeLocalCandidate(self.candidates[idx], number)
-        elif expression.op == idaapi.cot_sub and expression.y.op == idaapi.cot_num:
-            if expression.x.op == idaapi.cot_var and expression.x.v.idx in self.candidates:
-                idx = expression.x.v.idx
-                number = -expression.y.numval()
-                if idx in self.potential_negatives:
-                    self.potential_negatives[idx].offsets.append(number)
+        if expression.op == idaapi.cot_call:
+            result = _find_containing_record(expression)
+            if result:
+                idx, negative_lvar = result
+                self.__negative_lvars[idx] = negative_lvar
+        elif expression.x.op == idaapi.cot_var and expression.y.op == idaapi.cot_num:
+            idx = expression.x.v.idx
+            self.__offset_lvars.add(idx)
+            if idx in self.__structure_pointers:
+                if expression.op == idaapi.cot_add:
+                    number = expression.y.numval()
+                    if self.__structure_pointers[idx].get_size() <= number:
+                        self.__offsets.setdefault(idx, []).append(number)
                 else:
-                    self.potential_negatives[idx] = NegativeLocalCandidate(self.candidates[idx], number)
+                    self.__offsets.setdefault(idx, []).append(-expression.y.numval())
 
-        return 0
+    def finish(self, cfunc):
+        try:
+            negative_lvars = self.__negative_lvars
+            negative_lvars.update(self.__commented_lvars)
 
-
-class PotentialNegativeCollector(callbacks.HexRaysEventHandler):
-    def __init__(self):
-        super(PotentialNegativeCollector, self).__init__()
-
-    def handle(self, event, *args):
-        global potential_negatives
-
-        cfunc, level_of_maturity = args
-        if level_of_maturity == idaapi.CMAT_BUILT:
-            # First search for CONTAINING_RECORD made by Ida
-            visitor = SearchVisitor(cfunc)
-            visitor.apply_to(cfunc.body, None)
-            negative_lvars = visitor.result
-
-            # Second get saved information from comments
-            lvars = cfunc.get_lvars()
-            for idx in range(len(lvars)):
-                result = _parse_magic_comment(lvars[idx])
-                if result and result.tinfo.equals_to(lvars[idx].type().get_pointed_object()):
-                    negative_lvars[idx] = result
-
-            # Third analyze local variables that are a structure pointers and have references going beyond
-            # structure boundaries. This variables will be considered as potential pointers to substructure
-            # and will get a special menu on right click
-
-            # First collect all structure pointers
-            structure_pointer_variables = {}
-            for idx in set(range(len(lvars))) - set(negative_lvars.keys()):
-                if lvars[idx].type().is_ptr():
-                    pointed_tinfo = lvars[idx].type().get_pointed_object()
-                    if pointed_tinfo.is_udt():
-                        structure_pointer_variables[idx] = pointed_tinfo
-
-            # Then use them in order to find all potential negative offset situations
-            if structure_pointer_variables:
-                visitor = AnalyseVisitor(structure_pointer_variables)
-                visitor.apply_to(cfunc.body, None)
+            for idx, offsets in self.__offsets.items():
+                if idx not in negative_lvars:
+                    candidate = NegativeLocalCandidate(self.__structure_pointers[idx], offsets[0])
+                    candidate.offsets.extend(offsets[1:])
+                    potential_negatives[idx] = candidate
 
             # If negative offsets were found, then we replace them with CONTAINING_RECORD macro
-            if negative_lvars:
+            if self.__offset_lvars.intersection(negative_lvars):
                 visitor = ReplaceVisitor(negative_lvars)
                 visitor.apply_to(cfunc.body, None)
+        finally:
+            self.__reset()
 
 
-callbacks.hx_callback_manager.register(idaapi.hxe_maturity, PotentialNegativeCollector())
+fused_visitor_manager.register(idaapi.CMAT_BUILT, PotentialNegativeCollector())
 
 
 class ResetContainingStructure(actions.HexRaysPopupAction):
@@ -8,6 +8,7 @@ from . import actions
 import HexRaysPyTools.api as api
 import HexRaysPyTools.core.helper as helper
 import HexRaysPyTools.settings as settings
+from HexRaysPyTools.core.call_graph import call_graph
 
 
 logger = logging.getLogger(__name__)
@@ -254,7 +255,7 @@ class RenameUsingAssert(actions.HexRaysPopupAction):
         assert_func_ea = expr_call.x.obj_ea
 
         # Iterate through all places where assert function and rename using helper class
-        all_callers = helper.get_funcs_calling_address(assert_func_ea)
+        all_callers = call_graph.get_callers(assert_func_ea)
         for caller_ea in all_callers:
             cfunc = helper.decompile_function(caller_ea)
             if cfunc:
@@ -3,8 +3,12 @@ from . import actions
 import HexRaysPyTools.api as api
 import HexRaysPyTools.core.cache as cache
 import HexRaysPyTools.core.helper as helper
+import HexRaysPyTools.core.structure_inference as structure_inference
+import HexRaysPyTools.forms as forms
 from ..core.variable_scanner import NewShallowSearchVisitor, NewDeepSearchVisitor, DeepReturnVisitor
-from ..core.temporary_structure import TemporaryStructureModel
+from ..core.structure_registry import structure_registry
+from ..core.temporary_structure import TemporaryStructure
+from ..core.touch_pipeline import TouchPipeline
 
 
 class Scanner(actions.HexRaysPopupAction):
@@ -34,11 +38,11 @@ class ShallowScanVariable(Scanner):
     def activate(self, ctx):
         hx_view = idaapi.get_widget_vdui(ctx.widget)
         cfunc = hx_view.cfunc
-        origin = cache.temporary_structure.main_offset
+        origin = structure_registry.active.main_offset
 
         if self._can_be_scanned(cfunc, hx_view.item):
             obj = api.ScanObject.create(cfunc, hx_view.item)
-            visitor = NewShallowSearchVisitor(cfunc, origin, obj, cache.temporary_structure)
+            visitor = NewShallowSearchVisitor(cfunc, origin, obj, structure_registry.active)
             visitor.process()
 
 
@@ -52,13 +56,13 @@ class DeepScanVariable(Scanner):
     def activate(self, ctx):
         hx_view = idaapi.get_widget_vdui(ctx.widget)
         cfunc = hx_view.cfunc
-        origin = cache.temporary_structure.main_offset
+        origin = structure_registry.active.main_offset
 
         if self._can_be_scanned(cfunc, hx_view.item):
             obj = api.ScanObject.create(cfunc, hx_view.item)
-            if helper.FunctionTouchVisitor(cfunc).process():
+            if TouchPipeline(cfunc.entry_ea).process():
                 hx_view.refresh_view(True)
-            visitor = NewDeepSearchVisitor(hx_view.cfunc, origin, obj, cache.temporary_structure)
+            visitor = NewDeepSearchVisitor(hx_view.cfunc, origin, obj, structure_registry.active)
             visitor.process()
 
 
@@ -76,7 +80,7 @@ class RecognizeShape(Scanner):
             return
 
         obj = api.ScanObject.create(cfunc, hx_view.item)
-        tmp_struct = TemporaryStructureModel()
+        tmp_struct = TemporaryStructure()
         visitor = NewShallowSearchVisitor(cfunc, 0, obj, tmp_struct)
         visitor.process()
         tinfo = tmp_struct.get_recognized_shape()
@@ -107,8 +111,8 @@ class DeepScanReturn(Scanner):
         hx_view = idaapi.get_widget_vdui(ctx.widget)
         func_ea = hx_view.cfunc.entry_ea
         obj = api.ReturnedObject(func_ea)
-        origin = cache.temporary_structure.main_offset
-        visitor = DeepReturnVisitor(hx_view.cfunc, origin, obj, cache.temporary_structure)
+        origin = structure_registry.active.main_offset
+        visitor = DeepReturnVisitor(hx_view.cfunc, origin, obj, structure_registry.active)
         visitor.process()
 
 
@@ -124,7 +128,7 @@ class DeepScanFunctions(actions.Action):
             cfunc = helper.decompile_function(func_ea)
             obj = api.VariableObject(cfunc.get_lvars()[0], 0)
             if cfunc:
-                NewDeepSearchVisitor(cfunc, 0, obj, cache.temporary_structure).process()
+                NewDeepSearchVisitor(cfunc, 0, obj, structure_registry.active).process()
 
     def update(self, ctx):
         if ctx.form_type == idaapi.BWN_FUNCS:
@@ -133,8 +137,66 @@ class DeepScanFunctions(actions.Action):
         return idaapi.AST_DISABLE_FOR_WIDGET
 
 
+def _choose_inferred_structure():
+    """ Lists structures of the last inference, the selected one is shown in Structure Builder """
+    items = [[x.name, str(len(x.seeds)), str(len(x.structure.items))] for x in cache.inferred_structures]
+    chooser = forms.MyChoose(items, "Inferred Structures", [["Name", 25], ["Seeds", 5], ["Members", 5]])
+    idx = chooser.Show(modal=True)
+    if idx != -1:
+        inferred = cache.inferred_structures[idx]
+        for name in structure_registry.names():
+            if structure_registry.get(name) is inferred.structure:
+                structure_registry.select(name)
+                break
+        else:
+            structure_registry.add(inferred.name, inferred.structure)
+
+
+class InferStructures(actions.Action):
+    description = "Infer Structures from First Arguments"
+
+    def __init__(self):
+        super(InferStructures, self).__init__()
+
+    def activate(self, ctx):
+        seeds = [(idaapi.getn_func(idx - 1).start_ea, 0) for idx in ctx.chooser_selection]
+        cache.inferred_structures[:] = structure_inference.infer_structures(seeds)
+        if not cache.inferred_structures:
+            print("[Info] No structures have been inferred")
+            return
+        _choose_inferred_structure()
+
+    def update(self, ctx):
+        if ctx.form_type == idaapi.BWN_FUNCS:
+            idaapi.attach_action_to_popup(ctx.widget, None, self.name)
+            return idaapi.AST_ENABLE_FOR_WIDGET
+        return idaapi.AST_DISABLE_FOR_WIDGET
+
+
+class ShowInferredStructures(actions.Action):
+    description = "Show Inferred Structures"
+
+    def __init__(self):
+        super(ShowInferredStructures, self).__init__()
+
+    def activate(self, ctx):
+        if not cache.inferred_structures:
+            print("[Info] No structures have been inferred yet")
+            return
+        _choose_inferred_structure()
+
+    def update(self, ctx):
+        if ctx.form_type == idaapi.BWN_FUNCS and cache.inferred_structures:
+            idaapi.attach_action_to_popup(ctx.widget, None, self.name)
+        return idaapi.AST_ENABLE_ALWAYS
+
+
 actions.action_manager.register(ShallowScanVariable())
 actions.action_manager.register(DeepScanVariable())
 actions.action_manager.register(RecognizeShape())
 actions.action_manager.register(DeepScanReturn())
 actions.action_manager.register(DeepScanFunctions())
+actions.action_manager.register(InferStructures())
+show_inferred_structures = ShowInferredStructures()
+actions.action_manager.register(show_inferred_structures)
+idaapi.attach_action_to_menu('View/Open subviews/Local types', show_inferred_structures.name, idaapi.SETMENU_APP)
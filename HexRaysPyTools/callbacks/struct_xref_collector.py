@@ -2,10 +2,15 @@ import logging
 import time
 
 import idaapi
+import idautils
 
+from . import actions
 from . import callbacks
 import HexRaysPyTools.core.struct_xrefs as struct_xrefs
 import HexRaysPyTools.core.helper as helper
+import HexRaysPyTools.settings as settings
+from HexRaysPyTools.core.cfunc_cache import cfunc_cache, internal_decompilation
+from HexRaysPyTools.core.work_queue import WorkQueue
 
 logger = logging.getLogger(__name__)
 
@@ -55,10 +60,15 @@ class StructXrefCollectorVisitor(idaapi.ctree_parentee_t):
     def process(self):
         t = time.time()
         self.apply_to(self.__cfunc.body, None)
-        self.__storage.update(self.__function_address - idaapi.get_imagebase(), self.__result)
+        function_offset = self.__function_address - idaapi.get_imagebase()
+        self.__storage.update(function_offset, self.__result)
+        self.__storage.set_function_hash(function_offset, helper.get_function_hash(self.__function_address))
 
-        storage_mb_size = len(self.__storage) * 1.0 // 1024 ** 2
-        logger.debug("Xref processing: %f seconds passed, storage size - %.2f MB ", (time.time() - t), storage_mb_size)
+        if logger.isEnabledFor(logging.DEBUG):
+            stats = self.__storage.stats()
+            logger.debug(
+                "Xref processing: %f seconds passed, storage - %d xrefs, %d functions, %d structures, %.2f MB",
+                time.time() - t, stats.entries, stats.functions, stats.ordinals, stats.bytes * 1.0 / 1024 ** 2)
 
     def __find_ref_address(self, cexpr):
         """ Returns most close virtual address corresponding to cexpr """
@@ -99,9 +109,100 @@ class StructXrefCollector(callbacks.HexRaysEventHandler):
         super(StructXrefCollector, self).__init__()
 
     def handle(self, event, *args):
-        cfunc, level_of_maturity = args
-        if level_of_maturity == idaapi.CMAT_FINAL:
-            StructXrefCollectorVisitor(cfunc, struct_xrefs.XrefStorage()).process()
+        if not settings.STORE_XREFS:
+            return
+        cfunc = args[0]
+        if internal_decompilation.active:
+            # Plugin can decompile the same function several times during one scan, xrefs are collected once after it
+            if settings.COLLECT_INTERNAL_XREFS:
+                func_ea = cfunc.entry_ea
+                internal_decompilation.defer(("xrefs", func_ea), lambda: self.__collect_cached(func_ea))
+            return
+        StructXrefCollectorVisitor(cfunc, struct_xrefs.XrefStorage()).process()
+
+    @staticmethod
+    def __collect_cached(func_ea):
+        storage = struct_xrefs.XrefStorage()
+        cfunc = cfunc_cache.get(func_ea)
+        if cfunc:
+            StructXrefCollectorVisitor(cfunc, storage).process()
+        else:
+            # Function has been evicted from cache and its stored xrefs may be stale even if its bytes are the same,
+            # forgetting its hash makes "Build struct xref index" visit it again
+            storage.reset_function_hash(func_ea - idaapi.get_imagebase())
+
+
+callbacks.hx_callback_manager.register(idaapi.hxe_maturity, StructXrefCollector(), idaapi.CMAT_FINAL)
+
+
+class StructXrefIndexer(object):
+    """
+    Decompiles all functions in database so that their xrefs get collected by `StructXrefCollector`. Functions
+    which bytes haven't changed since their xrefs were collected are skipped. Storage is saved every
+    `XREF_INDEX_CHECKPOINT` functions, so the work isn't lost if IDA crashes.
+    """
+
+    def __init__(self, storage):
+        self.__storage = storage
+        self.__since_checkpoint = 0
+        self.decompiled = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def run(self):
+        queue = WorkQueue("Building struct xref index", idautils.Functions(), idaapi.get_short_name)
+        try:
+            completed = queue.run(self.__index)
+        finally:
+            self.__storage.save()
+        print("[Info] Struct xref index {}: {} functions decompiled, {} up to date, {} failed".format(
+            "built" if completed else "building cancelled", self.decompiled, self.skipped, self.failed))
+
+    def __index(self, func_ea):
+        func = idaapi.get_func(func_ea)
+        if func is None or func.flags & idaapi.FUNC_THUNK or helper.is_imported_ea(func_ea):
+            return
+
+        function_offset = func_ea - idaapi.get_imagebase()
+        function_hash = helper.get_function_hash(func_ea)
+        if self.__storage.is_function_fresh(function_offset, function_hash):
+            self.skipped += 1
+            return
+
+        # Makes Hex-Rays decompile the function from scratch, so StructXrefCollector is called at CMAT_FINAL
+        idaapi.mark_cfunc_dirty(func_ea)
+        try:
+            cfunc = idaapi.decompile(func_ea)
+        except idaapi.DecompilationFailure:
+            cfunc = None
+        if cfunc is None:
+            # Hash isn't stored, so failed function is tried again next time
+            self.failed += 1
+        else:
+            self.decompiled += 1
+
+        self.__since_checkpoint += 1
+        if self.__since_checkpoint >= settings.XREF_INDEX_CHECKPOINT:
+            self.__since_checkpoint = 0
+            self.__storage.save()
+
+
+class BuildStructXrefIndex(actions.Action):
+    description = "Build struct xref index"
+
+    def __init__(self):
+        super(BuildStructXrefIndex, self).__init__()
+
+    def activate(self, ctx):
+        if not settings.STORE_XREFS:
+            print("[Warning] Storing xrefs is disabled in settings")
+            return
+        StructXrefIndexer(struct_xrefs.XrefStorage()).run()
+
+    def update(self, ctx):
+        return idaapi.AST_ENABLE_ALWAYS
 
 
-callbacks.hx_callback_manager.register(idaapi.hxe_maturity, StructXrefCollector())
+build_struct_xref_index = BuildStructXrefIndex()
+actions.action_manager.register(build_struct_xref_index)
+idaapi.attach_action_to_menu('Edit/Plugins/', build_struct_xref_index.name, idaapi.SETMENU_APP)
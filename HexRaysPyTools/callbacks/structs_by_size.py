@@ -5,25 +5,43 @@ import HexRaysPyTools.forms as forms
 import HexRaysPyTools.core.type_library as type_library
 
 
+class _TypeBySizeChoose(forms.MyChoose):
+    """ Declarations are printed only for lines that are actually shown """
+
+    def __init__(self, items, library):
+        forms.MyChoose.__init__(
+            self,
+            items,
+            "Select Type",
+            [["Ordinal", 5 | idaapi.Choose.CHCOL_HEX], ["Type Name", 25], ["Declaration", 50]],
+            165
+        )
+        self.__library = library
+
+    def OnGetLine(self, n):
+        line = self.items[n]
+        if line[2] is None:
+            tinfo = idaapi.tinfo_t()
+            tinfo.create_typedef(self.__library, int(line[0]))
+            line[2] = idaapi.print_tinfo(None, 0, 0, idaapi.PRTYPE_DEF, tinfo, None, None)
+        return line
+
+
 def _choose_structure_by_size(size):
     result = type_library.choose_til()
     if result:
         selected_library, max_ordinal, is_local_type = result
         matched_types = []
         tinfo = idaapi.tinfo_t()
-        for ordinal in range(1, max_ordinal):
-            tinfo.create_typedef(selected_library, ordinal)
-            if tinfo.get_size() == size:
+        for ordinal in type_library.get_ordinals_by_size(selected_library, max_ordinal, size):
+            name = idaapi.get_numbered_type_name(selected_library, ordinal)
+            if not name:
+                # Types without name are shown as they are printed
+                tinfo.create_typedef(selected_library, ordinal)
                 name = tinfo.dstr()
-                description = idaapi.print_tinfo(None, 0, 0, idaapi.PRTYPE_DEF, tinfo, None, None)
-                matched_types.append([str(ordinal), name, description])
+            matched_types.append([str(ordinal), name, None])
 
-        type_chooser = forms.MyChoose(
-            matched_types,
-            "Select Type",
-            [["Ordinal", 5 | idaapi.Choose.CHCOL_HEX], ["Type Name", 25], ["Declaration", 50]],
-            165
-        )
+        type_chooser = _TypeBySizeChoose(matched_types, selected_library)
         selected_type = type_chooser.Show(True)
         if selected_type != -1:
             if is_local_type:
@@ -1,8 +1,9 @@
 import idaapi
-import idc
 
 from . import actions
 from . import callbacks
+import HexRaysPyTools.settings as settings
+from HexRaysPyTools.core.swapped_ifs import has_inverted, get_inverted, invert
 
 
 def inverse_if_condition(cif):
@@ -20,46 +21,6 @@ def inverse_if(cif):
     idaapi.qswap(cif.ithen, cif.ielse)
 
 
-_ARRAY_STORAGE_PREFIX = "$HexRaysPyTools:IfThenElse:"
-
-
-def has_inverted(func_ea):
-    # Find if function has any swapped THEN-ELSE branches
-    internal_name = _ARRAY_STORAGE_PREFIX + hex(int(func_ea - idaapi.get_imagebase()))
-    internal_id = idc.get_array_id(internal_name)
-    return internal_id != -1
-
-
-def get_inverted(func_ea):
-    # Returns set of relative virtual addresses which are tied to IF and swapped
-    internal_name = _ARRAY_STORAGE_PREFIX + hex(int(func_ea - idaapi.get_imagebase()))
-    internal_id = idc.get_array_id(internal_name)
-    array = idc.get_array_element(idc.AR_STR, internal_id, 0)
-    return set(map(int, array.split()))
-
-
-def invert(func_ea, if_ea):
-    # Store information about swaps (affected through actions)
-    iv_rva = if_ea - idaapi.get_imagebase()
-    func_rva = func_ea - idaapi.get_imagebase()
-    internal_name = _ARRAY_STORAGE_PREFIX + hex(int(func_rva))
-    internal_id = idc.get_array_id(internal_name)
-    if internal_id == -1:
-        internal_id = idc.create_array(internal_name)
-        idc.set_array_string(internal_id, 0, str(iv_rva))
-    else:
-        inverted = get_inverted(func_ea)
-        try:
-            inverted.remove(iv_rva)
-            if not inverted:
-                idc.delete_array(internal_id)
-
-        except KeyError:
-            inverted.add(iv_rva)
-
-        idc.set_array_string(internal_id, 0, " ".join(map(str, inverted)))
-
-
 class SwapThenElse(actions.HexRaysPopupAction):
     description = "Swap then/else"
     hotkey = "Shift+S"
@@ -174,13 +135,13 @@ class SilentIfSwapper(callbacks.HexRaysEventHandler):
     def handle(self, event, *args):
         cfunc, level_of_maturity = args
         if level_of_maturity == idaapi.CMAT_TRANS1 and has_inverted(cfunc.entry_ea):
-            # Make RVA from VA of IF instructions that should be inverted
-            inverted = [n + idaapi.get_imagebase() for n in get_inverted(cfunc.entry_ea)]
-            visitor = SwapThenElseVisitor(inverted)
+            visitor = SwapThenElseVisitor(get_inverted(cfunc.entry_ea))
             visitor.apply_to(cfunc.body, None)
-        elif level_of_maturity == idaapi.CMAT_TRANS2:
+        elif level_of_maturity == idaapi.CMAT_TRANS2 and settings.UNTANGLE_IF_STATEMENTS:
             visitor = SpaghettiVisitor()
             visitor.apply_to(cfunc.body, None)
 
 
-callbacks.hx_callback_manager.register(idaapi.hxe_maturity, SilentIfSwapper())
+silent_if_swapper = SilentIfSwapper()
+callbacks.hx_callback_manager.register(idaapi.hxe_maturity, silent_if_swapper, idaapi.CMAT_TRANS1)
+callbacks.hx_callback_manager.register(idaapi.hxe_maturity, silent_if_swapper, idaapi.CMAT_TRANS2)
@@ -5,6 +5,11 @@ import idautils
 import idc
 
 from . import common
+from . import swapped_ifs
+from . import type_library
+from .call_graph import call_graph
+from .cfunc_cache import cfunc_cache
+from .type_shapes import type_shape_index
 
 # All virtual addresses where imported by module function pointers are stored
 imported_ea = set()
@@ -13,12 +18,14 @@ imported_ea = set()
 demangled_names = collections.defaultdict(set)
 
 # Functions that went through "touching" decompilation. This is done before Deep Scanning and
-# enhance arguments parsing for subroutines called by scanned functions.
-touched_functions = set()
+# enhance arguments parsing for subroutines called by scanned functions. Maps function to the number of levels of its
+# callees that have been touched too. Stored in database as array of these numbers indexed by RVA, see
+# `helper.to_node_index`
+touched_functions = {}
+TOUCHED_FUNCTIONS_ARRAY_NAME = "$HexRaysPyTools:TouchedFunctions"
 
-# This is where all information about structure being reconstructed stored
-# TODO: Make some way to store several structures and switch between them. See issue #22 (3)
-temporary_structure = None      # type: temporary_structure.TemporaryStructureModel
+# Results of the last structure inference, list of structure_inference.InferredStructure
+inferred_structures = []
 
 
 def _init_imported_ea():
@@ -58,15 +65,46 @@ def _init_demangled_names():
     print("[DEBUG] Demangled names have been initialized")
 
 
-def _reset_touched_functions(*args):
-    global touched_functions
+def _init_touched_functions():
+    touched_functions.clear()
+    array_id = idc.get_array_id(TOUCHED_FUNCTIONS_ARRAY_NAME)
+    if array_id == -1:
+        return
 
-    touched_functions = set()
+    from .helper import from_node_index
+
+    image_base = idaapi.get_imagebase()
+    idx = idc.get_first_index(idc.AR_LONG, array_id)
+    while idx != -1:
+        touched_functions[from_node_index(idx) + image_base] = idc.get_array_element(idc.AR_LONG, array_id, idx)
+        idx = idc.get_next_index(idc.AR_LONG, array_id, idx)
+    print("[DEBUG] {} touched functions have been loaded".format(len(touched_functions)))
+
+
+def add_touched_function(func_ea, depth):
+    """ Function has been touched together with `depth` levels of its callees """
+    if touched_functions.get(func_ea, -1) >= depth:
+        return
+    from .helper import to_node_index
+
+    touched_functions[func_ea] = depth
+    array_id = idc.get_array_id(TOUCHED_FUNCTIONS_ARRAY_NAME)
+    if array_id == -1:
+        array_id = idc.create_array(TOUCHED_FUNCTIONS_ARRAY_NAME)
+    idc.set_array_long(array_id, to_node_index(func_ea - idaapi.get_imagebase()), depth)
 
 
 def initialize_cache(*args):
-    global temporary_structure
+    # temporary_structure depends on this module through helper
+    from .temporary_structure import clear_tinfo_pool
 
     _init_demangled_names()
     _init_imported_ea()
-    _reset_touched_functions()
+    _init_touched_functions()
+    swapped_ifs.load()
+    cfunc_cache.clear()
+    call_graph.clear()
+    type_shape_index.invalidate()
+    type_library.clear_indices()
+    del inferred_structures[:]
+    clear_tinfo_pool()
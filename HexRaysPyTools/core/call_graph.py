@@ -0,0 +1,141 @@
+import logging
+import time
+
+import idaapi
+import idautils
+import idc
+
+logger = logging.getLogger(__name__)
+
+
+class CallGraph(object):
+    """
+    Cache of callers and callees of functions. Adjacency of a function is calculated from code xrefs on the first
+    request or for all functions at once by `build`, and is dropped when the function, functions calling it or code
+    references between them change.
+    Only addresses of function starts are cached, callers of other addresses (e.g. imports) are calculated every time.
+    """
+
+    def __init__(self):
+        self.__callers = {}     # {func_ea: frozenset(start addresses of calling functions)}
+        self.__callees = {}     # {func_ea: frozenset(start addresses of called functions)}
+
+    def get_callers(self, ea):
+        """ Returns start addresses of functions which make call to `ea` """
+        callers = self.__callers.get(ea)
+        if callers is None:
+            callers = self.__calculate_callers(ea)
+            if self.__is_function_start(ea):
+                self.__callers[ea] = callers
+        return callers
+
+    def get_callees(self, func_ea):
+        """ Returns start addresses of all functions which are called or jumped to from a function at `func_ea` """
+        callees = self.__callees.get(func_ea)
+        if callees is None:
+            callees = self.__calculate_callees(func_ea)
+            if self.__is_function_start(func_ea):
+                self.__callees[func_ea] = callees
+        return callees
+
+    def get_transitive_callers(self, ea, max_depth):
+        """ Returns {function start: distance} of functions calling `ea` directly or through up to `max_depth` calls """
+        return self.__walk(ea, max_depth, self.get_callers)
+
+    def get_transitive_callees(self, func_ea, max_depth):
+        """ Returns {function start: distance} of functions reachable from `func_ea` in up to `max_depth` calls """
+        return self.__walk(func_ea, max_depth, self.get_callees)
+
+    def build(self):
+        """ Calculates adjacency of all functions at once, callers are taken by reversing callees """
+        t = time.time()
+        callers = dict((func_ea, set()) for func_ea in idautils.Functions())
+        for func_ea in callers:
+            callees = self.__calculate_callees(func_ea)
+            self.__callees[func_ea] = callees
+            for callee_ea in callees:
+                callers.setdefault(callee_ea, set()).add(func_ea)
+        self.__callers = dict((func_ea, frozenset(eas)) for func_ea, eas in callers.items())
+        logger.debug("Call graph of {} functions built in {:.3f} seconds".format(len(callers), time.time() - t))
+
+    def invalidate(self, func_ea):
+        """ Function at `func_ea` has been changed, added or deleted """
+        # Called for every function during auto-analysis, when usually nothing is cached yet
+        if not self.__callers and not self.__callees:
+            return
+        self.__callees.pop(func_ea, None)
+        old_callers = self.__callers.pop(func_ea, frozenset())
+        if self.__callers:
+            # Both functions it used to call and it calls now get another set of callers
+            callees = self.__calculate_callees(func_ea) if self.__is_function_start(func_ea) else frozenset()
+            for ea in [ea for ea, callers in self.__callers.items() if func_ea in callers or ea in callees]:
+                del self.__callers[ea]
+        if self.__callees:
+            # Callers of just added function have no callee for it
+            for caller_ea in old_callers | self.__calculate_callers(func_ea, verbose=False):
+                self.__callees.pop(caller_ea, None)
+
+    def invalidate_reference(self, from_ea, to_ea):
+        """ Code reference from `from_ea` to `to_ea` is being added or deleted """
+        # Called for every reference during auto-analysis, so it must be cheap. Only cached sets are dropped, because
+        # the reference itself may not be changed yet
+        if not self.__callers and not self.__callees:
+            return
+        self.__callers.pop(to_ea, None)
+        if self.__callees:
+            func = idaapi.get_func(from_ea)
+            if func:
+                self.__callees.pop(func.start_ea, None)
+
+    def clear(self):
+        self.__callers.clear()
+        self.__callees.clear()
+
+    @staticmethod
+    def __is_function_start(ea):
+        func = idaapi.get_func(ea)
+        return func is not None and func.start_ea == ea
+
+    @staticmethod
+    def __calculate_callers(ea, verbose=True):
+        callers = set()
+        xref_ea = idaapi.get_first_cref_to(ea)
+        while xref_ea != idaapi.BADADDR:
+            xref_func_ea = idc.get_func_attr(xref_ea, idc.FUNCATTR_START)
+            if xref_func_ea != idaapi.BADADDR:
+                callers.add(xref_func_ea)
+            elif verbose:
+                print("[Warning] Function not found at 0x{0:08X}".format(xref_ea))
+            else:
+                logger.debug("Function not found at 0x{0:08X}".format(xref_ea))
+            xref_ea = idaapi.get_next_cref_to(ea, xref_ea)
+        return frozenset(callers)
+
+    @staticmethod
+    def __calculate_callees(func_ea):
+        callees = set()
+        for item_ea in idautils.FuncItems(func_ea):
+            for ref_ea in idautils.CodeRefsFrom(item_ea, False):
+                func = idaapi.get_func(ref_ea)
+                if func and func.start_ea == ref_ea:
+                    callees.add(ref_ea)
+        return frozenset(callees)
+
+    @staticmethod
+    def __walk(ea, max_depth, get_adjacent):
+        result = {}
+        current_level = [ea]
+        for depth in range(1, max_depth + 1):
+            next_level = []
+            for current_ea in current_level:
+                for adjacent_ea in get_adjacent(current_ea):
+                    if adjacent_ea not in result and adjacent_ea != ea:
+                        result[adjacent_ea] = depth
+                        next_level.append(adjacent_ea)
+            if not next_level:
+                break
+            current_level = next_level
+        return result
+
+
+call_graph = CallGraph()
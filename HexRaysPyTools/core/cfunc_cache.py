@@ -0,0 +1,150 @@
+import collections
+import logging
+
+import idaapi
+
+import HexRaysPyTools.settings as settings
+from .scan_summaries import scan_summaries
+
+logger = logging.getLogger(__name__)
+
+# Decompiled function is much bigger than its machine code. This factor is used only to roughly estimate memory
+# occupied by cached functions
+CFUNC_BYTES_PER_CODE_BYTE = 200
+
+
+class InternalDecompilation(object):
+    """
+    Reentrant scope of decompilations started by the plugin itself: Deep Scan, touching callees and so on. Hooks called
+    during decompilation check it to skip analysis that is useful only for the user looking at pseudocode or to defer
+    their work until the outermost scope is left. Deferred jobs with the same key are run only once.
+    """
+
+    def __init__(self):
+        self.__depth = 0
+        self.__deferred = collections.OrderedDict()     # key -> job
+        self.__running = False
+
+    @property
+    def active(self):
+        return self.__depth > 0
+
+    def defer(self, key, job):
+        self.__deferred.pop(key, None)
+        self.__deferred[key] = job
+
+    def __enter__(self):
+        self.__depth += 1
+        return self
+
+    def __exit__(self, *args):
+        self.__depth -= 1
+        if self.__depth == 0 and not self.__running:
+            self.__run_deferred()
+        return False
+
+    def __run_deferred(self):
+        self.__running = True
+        try:
+            while self.__deferred:
+                key, job = self.__deferred.popitem(last=False)
+                try:
+                    job()
+                except Exception:
+                    logger.exception("Deferred job {} has failed".format(key))
+        finally:
+            self.__running = False
+
+
+internal_decompilation = InternalDecompilation()
+
+
+class CfuncCache(object):
+    """
+    Session-scoped cache of decompiled functions keyed by function start address. All decompilations made by the plugin
+    should go through it so that Deep Scan doesn't decompile the same callee again and again. Least recently used
+    functions are evicted when either count or estimated memory limit is exceeded.
+    """
+
+    def __init__(self):
+        self.__cfuncs = collections.OrderedDict()       # func_ea -> (cfunc, estimated_size)
+        self.__failed = set()
+        self.__memory = 0
+        self.hits = 0
+        self.misses = 0
+        self.failed_hits = 0        # lookups of functions known to fail, they don't make hit rate better
+        self.evictions = 0
+
+    def decompile(self, ea):
+        """ Returns cfunc of function containing `ea` or None if decompilation has failed """
+        func = idaapi.get_func(ea)
+        if func is None:
+            return None
+        func_ea = func.start_ea
+
+        if func_ea in self.__cfuncs:
+            self.hits += 1
+            cfunc, size = self.__cfuncs.pop(func_ea)
+            self.__cfuncs[func_ea] = (cfunc, size)
+            return cfunc
+        if func_ea in self.__failed:
+            self.failed_hits += 1
+            return None
+
+        self.misses += 1
+        # Function is cached before the scope ends, so deferred hooks can take it from here
+        with internal_decompilation:
+            try:
+                cfunc = idaapi.decompile(func_ea)
+            except idaapi.DecompilationFailure:
+                cfunc = None
+            if not cfunc:
+                self.__failed.add(func_ea)
+                return None
+
+            size = func.size() * CFUNC_BYTES_PER_CODE_BYTE
+            self.__cfuncs[func_ea] = (cfunc, size)
+            self.__memory += size
+            self.__shrink()
+        return cfunc
+
+    def get(self, func_ea):
+        """ Returns cached cfunc without decompiling it """
+        cached = self.__cfuncs.get(func_ea)
+        return cached[0] if cached else None
+
+    def invalidate(self, func_ea):
+        scan_summaries.invalidate(func_ea)
+        self.__failed.discard(func_ea)
+        if func_ea in self.__cfuncs:
+            _, size = self.__cfuncs.pop(func_ea)
+            self.__memory -= size
+
+    def clear(self):
+        scan_summaries.clear()
+        self.__cfuncs.clear()
+        self.__failed.clear()
+        self.__memory = 0
+
+    def __shrink(self):
+        max_memory = settings.CFUNC_CACHE_MEMORY * 1024 ** 2
+        while len(self.__cfuncs) > settings.CFUNC_CACHE_SIZE or self.__memory > max_memory:
+            if len(self.__cfuncs) == 1:
+                break
+            _, (_, size) = self.__cfuncs.popitem(last=False)
+            self.__memory -= size
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.__cfuncs)
+
+    def __contains__(self, func_ea):
+        return func_ea in self.__cfuncs
+
+    def __str__(self):
+        return "functions - {}, estimated size - {:.2f} MB, hits - {}, misses - {}, failed hits - {}, " \
+               "evictions - {}".format(len(self.__cfuncs), self.__memory * 1.0 / 1024 ** 2, self.hits, self.misses,
+                                       self.failed_hits, self.evictions)
+
+
+cfunc_cache = CfuncCache()
@@ -1,13 +1,15 @@
 import collections
 import logging
+import zlib
 
 import idaapi
+import idautils
 import idc
 
 import HexRaysPyTools.core.cache as cache
 import HexRaysPyTools.core.const as const
 import HexRaysPyTools.settings as settings
-import HexRaysPyTools.forms as forms
+from .cfunc_cache import cfunc_cache
 
 
 logger = logging.getLogger(__name__)
@@ -100,6 +102,7 @@ def choose_virtual_func_address(name, tinfo=None, offset=None):
     if len(addresses) == 1:
         return addresses[0]
 
+    import HexRaysPyTools.forms as forms
     chooser = forms.MyChoose(
         [[to_hex(ea), idc.demangle_name(idc.get_name(ea), idc.INF_LONG_DN)] for ea in addresses],
         "Select Function",
@@ -256,52 +259,12 @@ def import_structure(name, tinfo):
     return ordinal
 
 
-def get_funcs_calling_address(ea):
-    """ Returns all addresses of functions which make call to a function at `ea`"""
-    xref_ea = idaapi.get_first_cref_to(ea)
-    xrefs = set()
-    while xref_ea != idaapi.BADADDR:
-        xref_func_ea = idc.get_func_attr(xref_ea, idc.FUNCATTR_START)
-        if xref_func_ea != idaapi.BADADDR:
-            xrefs.add(xref_func_ea)
-        else:
-            print("[Warning] Function not found at 0x{0:08X}".format(xref_ea))
-        xref_ea = idaapi.get_next_cref_to(ea, xref_ea)
-    return xrefs
-
-
-class FunctionTouchVisitor(idaapi.ctree_parentee_t):
-    def __init__(self, cfunc):
-        super(FunctionTouchVisitor, self).__init__()
-        self.functions = set()
-        self.cfunc = cfunc
-
-    def visit_expr(self, expression):
-        if expression.op == idaapi.cot_call:
-            self.functions.add(expression.x.obj_ea)
-        return 0
-
-    def touch_all(self):
-        diff = self.functions.difference(cache.touched_functions)
-        for address in diff:
-            if is_imported_ea(address):
-                continue
-            try:
-                cfunc = idaapi.decompile(address)
-                if cfunc:
-                    FunctionTouchVisitor(cfunc).process()
-            except idaapi.DecompilationFailure:
-                logger.warn("IDA failed to decompile function at {}".format(to_hex(address)))
-                cache.touched_functions.add(address)
-        idaapi.decompile(self.cfunc.entry_ea)
-
-    def process(self):
-        if self.cfunc.entry_ea not in cache.touched_functions:
-            cache.touched_functions.add(self.cfunc.entry_ea)
-            self.apply_to(self.cfunc.body, None)
-            self.touch_all()
-            return True
-        return False
+def get_function_hash(ea):
+    """ Returns crc32 of all bytes of a function at `ea`, used to find out whether it has changed """
+    result = 0
+    for start_ea, end_ea in idautils.Chunks(ea):
+        result = zlib.crc32(idaapi.get_bytes(start_ea, end_ea - start_ea) or b"", result)
+    return result & 0xFFFFFFFF
 
 
 def to_hex(ea):
@@ -319,6 +282,16 @@ def to_nice_str(ea):
     return "{}+0x{:X}".format(func_name, offset)
 
 
+def to_node_index(offset):
+    """ Offsets from the image base are negative below it, while indices of netnodes and arrays are unsigned """
+    return offset & idaapi.BADADDR
+
+
+def from_node_index(index):
+    """ Reverse to `to_node_index` """
+    return index - (idaapi.BADADDR + 1) if index > idaapi.BADADDR >> 1 else index
+
+
 def save_long_str_to_idb(array_name, value):
     """ Overwrites old array completely in process """
     id = idc.get_array_id(array_name)
@@ -363,12 +336,10 @@ def create_padding_udt_member(offset, size):
 
 
 def decompile_function(address):
-    try:
-        cfunc = idaapi.decompile(address)
-        if cfunc:
-            return cfunc
-    except idaapi.DecompilationFailure:
-        pass
+    """ Decompiles function using session cache. Returns None if failed """
+    cfunc = cfunc_cache.decompile(address)
+    if cfunc:
+        return cfunc
     logger.warn("IDA failed to decompile function at 0x{address:08X}".format(address=address))
 
 
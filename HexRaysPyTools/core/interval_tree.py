@@ -0,0 +1,111 @@
+import random
+
+
+class _Node(object):
+    __slots__ = ('key', 'end', 'value', 'priority', 'left', 'right', 'max_end')
+
+    def __init__(self, key, end, value):
+        self.key = key
+        self.end = end
+        self.value = value
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = end
+
+    def update(self):
+        self.max_end = self.end
+        if self.left and self.left.max_end > self.max_end:
+            self.max_end = self.left.max_end
+        if self.right and self.right.max_end > self.max_end:
+            self.max_end = self.right.max_end
+
+
+class IntervalTree(object):
+    """
+    Set of half-open intervals [start, end) with values attached. Treap ordered by start and identity of the value,
+    every node knows the maximal end in its subtree. Adding, removing and searching intervals overlapping with the
+    given one take O(log n) on average plus the number of found intervals.
+    """
+
+    def __init__(self):
+        self.__root = None
+        self.__size = 0
+
+    def add(self, start, end, value):
+        left, right = self.__split(self.__root, (start, id(value)))
+        self.__root = self.__merge(self.__merge(left, _Node((start, id(value)), end, value)), right)
+        self.__size += 1
+
+    def remove(self, start, value):
+        """ Removes interval added with the same start and value. Returns False if it's not found """
+        self.__root, removed = self.__remove(self.__root, (start, id(value)))
+        if removed:
+            self.__size -= 1
+        return removed
+
+    def overlapping(self, start, end):
+        """ Returns values of intervals overlapping with [start, end) ordered by start """
+        result = []
+        stack = []
+        node = self.__root
+        # In-order traversal skipping subtrees which either end before `start` or begin after `end`
+        while stack or node:
+            if node and node.max_end > start:
+                stack.append(node)
+                node = node.left
+                continue
+            if not stack:
+                break
+            node = stack.pop()
+            if node.key[0] >= end:
+                break
+            if node.end > start:
+                result.append(node.value)
+            node = node.right
+        return result
+
+    def clear(self):
+        self.__root = None
+        self.__size = 0
+
+    def __len__(self):
+        return self.__size
+
+    def __split(self, node, key):
+        """ Splits tree into nodes with keys less than `key` and the rest """
+        if node is None:
+            return None, None
+        if node.key < key:
+            node.right, right = self.__split(node.right, key)
+            node.update()
+            return node, right
+        left, node.left = self.__split(node.left, key)
+        node.update()
+        return left, node
+
+    def __merge(self, left, right):
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self.__merge(left.right, right)
+            left.update()
+            return left
+        right.left = self.__merge(left, right.left)
+        right.update()
+        return right
+
+    def __remove(self, node, key):
+        if node is None:
+            return None, False
+        if node.key == key:
+            return self.__merge(node.left, node.right), True
+        if key < node.key:
+            node.left, removed = self.__remove(node.left, key)
+        else:
+            node.right, removed = self.__remove(node.right, key)
+        if removed:
+            node.update()
+        return node, removed
@@ -0,0 +1,39 @@
+import collections
+
+
+class ScanSummary(object):
+    """
+    What Deep Scan found in a function scanning one of its arguments: members relative to the argument and calls to
+    which the argument is passed. It doesn't depend on origin, so it can be replayed instead of visiting the function
+    again when another scan reaches it.
+    """
+
+    def __init__(self):
+        self.members = []       # [MemberRecipe]
+        self.calls = []         # [(func_ea, arg_idx)]
+
+
+class ScanSummaryCache(object):
+    """ Summaries of scanned functions, dropped together with decompiled function in `cfunc_cache` """
+
+    def __init__(self):
+        self.__summaries = collections.defaultdict(dict)    # {func_ea: {arg_idx: ScanSummary}}
+
+    def get(self, func_ea, arg_idx):
+        summaries = self.__summaries.get(func_ea)
+        return summaries.get(arg_idx) if summaries else None
+
+    def add(self, func_ea, arg_idx, summary):
+        self.__summaries[func_ea][arg_idx] = summary
+
+    def invalidate(self, func_ea):
+        self.__summaries.pop(func_ea, None)
+
+    def clear(self):
+        self.__summaries.clear()
+
+    def __len__(self):
+        return sum(len(x) for x in self.__summaries.values())
+
+
+scan_summaries = ScanSummaryCache()
@@ -1,14 +1,27 @@
+import bisect
 from collections import namedtuple, defaultdict
 import json
 import logging
+import struct
+import time
 
 import idaapi
+import idc
 from . import helper
 import HexRaysPyTools.settings as settings
 
 logger = logging.getLogger(__name__)
 
 XrefInfo = namedtuple('XrefInfo', ['func_ea', 'offset', 'line', 'type'])
+XrefStorageStats = namedtuple('XrefStorageStats', ['entries', 'functions', 'ordinals', 'bytes', 'last_update_time'])
+
+# Xrefs of every function are stored as a separate blob. Format (little-endian):
+#   version: u8, lines count: u32, lines: [length: u32, utf-8 bytes]
+#   ordinals count: u32, [ordinal: u32, fields count: u32, [field offset: u32, xrefs count: u32,
+#                                                           [code offset: i64, line index: u32, usage type: u8]]]
+_BLOB_VERSION = 1
+_USAGE_TYPES = ('R', 'W', 'Arg')
+_USAGE_TYPE_IDS = dict((usage_type, idx) for idx, usage_type in enumerate(_USAGE_TYPES))
 
 
 def singleton(cls):
@@ -21,67 +34,271 @@ def singleton(cls):
     return get_instance
 
 
+def _to_signed_64(value):
+    value &= 0xFFFFFFFFFFFFFFFF
+    return value - (1 << 64) if value >> 63 else value
+
+
+def encode_function_xrefs(data):
+    """ data - {ordinal: {field_offset: [(code_offset, line, usage_type)]}}. Lines are stored only once """
+    lines = []
+    line_indices = {}
+    body = [struct.pack("<I", len(data))]
+    for ordinal, fields in data.items():
+        body.append(struct.pack("<II", ordinal, len(fields)))
+        for field_offset, xrefs in fields.items():
+            body.append(struct.pack("<II", field_offset, len(xrefs)))
+            for code_offset, line, usage_type in xrefs:
+                line_idx = line_indices.get(line)
+                if line_idx is None:
+                    line_idx = line_indices[line] = len(lines)
+                    lines.append(line)
+                if usage_type not in _USAGE_TYPE_IDS:
+                    raise ValueError("Unknown usage type {}".format(usage_type))
+                body.append(struct.pack(
+                    "<qIB", _to_signed_64(code_offset), line_idx, _USAGE_TYPE_IDS[usage_type]))
+
+    header = [struct.pack("<BI", _BLOB_VERSION, len(lines))]
+    for line in lines:
+        if not isinstance(line, bytes):
+            line = line.encode("utf-8")
+        header.append(struct.pack("<I", len(line)))
+        header.append(line)
+    return b"".join(header + body)
+
+
+def decode_function_xrefs(blob):
+    """ Reverse to `encode_function_xrefs`, raises ValueError or struct.error if blob is damaged """
+    version, lines_count = struct.unpack_from("<BI", blob, 0)
+    if version != _BLOB_VERSION:
+        raise ValueError("Unknown xref blob version {}".format(version))
+    position = struct.calcsize("<BI")
+
+    lines = []
+    for _ in range(lines_count):
+        length, = struct.unpack_from("<I", blob, position)
+        position += 4
+        if position + length > len(blob):
+            raise ValueError("Xref blob is truncated")
+        lines.append(blob[position:position + length].decode("utf-8"))
+        position += length
+
+    xref_size = struct.calcsize("<qIB")
+    result = {}
+    ordinals_count, = struct.unpack_from("<I", blob, position)
+    position += 4
+    for _ in range(ordinals_count):
+        ordinal, fields_count = struct.unpack_from("<II", blob, position)
+        position += 8
+        fields = result[ordinal] = {}
+        for _ in range(fields_count):
+            field_offset, xrefs_count = struct.unpack_from("<II", blob, position)
+            position += 8
+            xrefs = fields[field_offset] = []
+            for _ in range(xrefs_count):
+                code_offset, line_idx, usage_type_id = struct.unpack_from("<qIB", blob, position)
+                position += xref_size
+                if line_idx >= len(lines) or usage_type_id >= len(_USAGE_TYPES):
+                    raise ValueError("Xref blob is corrupted")
+                xrefs.append((code_offset, lines[line_idx], _USAGE_TYPES[usage_type_id]))
+    return result
+
+
 @singleton
 class XrefStorage(object):
-    ARRAY_NAME = "$HexRaysPyTools:XrefStorage"
+    """
+    Keeps information about structure fields usage collected during decompilation. Every function has its own
+    netnode with two blobs: encoded xrefs (tag 'X') and list of referenced ordinals (tag 'O'). Index netnode maps
+    function offset to the size of its xrefs blob and the number of xrefs in it, and ordinal to the number of
+    functions referencing it, so that statistics are available without reading any blob. It also keeps hashes of
+    functions whose xrefs have been collected, so up-to-date functions can be skipped when building the index. Blobs
+    are read only when they are needed, and only functions that were changed are written back.
+    """
+    INDEX_NODE_NAME = "$HexRaysPyTools:Xrefs"
+    FUNCTION_NODE_PREFIX = "$HexRaysPyTools:Xrefs:"
+    LEGACY_ARRAY_NAME = "$HexRaysPyTools:XrefStorage"
+    XREFS_TAG = 'X'
+    ORDINALS_TAG = 'O'
+    ENTRIES_TAG = 'E'
+    ORDINAL_COUNTS_TAG = 'N'
+    HASHES_TAG = 'H'
 
     def __init__(self):
         """
-        storage - {ordinal: {func_offset: (code_offset, line, usage_type)}}
-        __delete_items_helper - {func_offset: set(ordinals)}
+        __sizes - {func_offset: blob size}
+        __entries - {func_offset: number of xrefs}
+        __ordinal_counts - {ordinal: number of functions referencing it}
+        __hashes - {func_offset: hash of function bytes at the moment of collecting its xrefs}
+        __functions - {func_offset: {ordinal: {struct_offset: [(code_offset, line, usage_type)]}}}, loaded lazily
+        __function_ordinals - {func_offset: set(ordinals)}, loaded lazily
+        __ordinal_functions - {ordinal: set(func_offsets)}, built on first request
+        __field_functions - {ordinal: {struct_offset: sorted [func_offsets]}}, built on first request of the ordinal
+        __field_offsets - {ordinal: sorted [struct_offsets]} referenced at least by one function
+        __dirty - {func_offset: blob} of functions that haven't been written to database yet
+        __dirty_ordinals - ordinals which function counts haven't been written to database yet
+        __dirty_hashes - functions which hashes haven't been written to database yet
         """
-        self.storage = None
-        self.__delete_items_helper = defaultdict(set)
+        self.__node = None
+        self.__sizes = {}
+        self.__size = 0
+        self.__entries = {}
+        self.__entry_count = 0
+        self.__ordinal_counts = {}
+        self.__hashes = {}
+        self.__last_update_time = 0.0
+        self.__functions = {}
+        self.__function_ordinals = {}
+        self.__ordinal_functions = None
+        self.__field_functions = {}
+        self.__field_offsets = {}
+        self.__dirty = {}
+        self.__dirty_ordinals = set()
+        self.__dirty_hashes = set()
 
     def open(self):
+        self.__reset()
         if not settings.STORE_XREFS:
-            self.storage = {}
             return
 
-        result = helper.load_long_str_from_idb(self.ARRAY_NAME)
-        if result:
-            try:
-                self.storage = json.loads(result, object_hook=self.json_keys_to_str)
-                self.__init_delete_helper()
-                return
-            except ValueError:
-                logger.error("Failed to read previous info about Xrefs. Try Ctrl+F5 to cache data")
-        self.storage = {}
+        self.__node = idaapi.netnode(self.INDEX_NODE_NAME, 0, True)
+        index = self.__node.altfirst()
+        while index != idaapi.BADNODE:
+            func_offset = helper.from_node_index(index)
+            size = self.__node.altval(index)
+            self.__sizes[func_offset] = size
+            self.__size += size
+            entries = self.__node.altval(index, self.ENTRIES_TAG)
+            self.__entries[func_offset] = entries
+            self.__entry_count += entries
+            index = self.__node.altnext(index)
+
+        ordinal = self.__node.altfirst(self.ORDINAL_COUNTS_TAG)
+        while ordinal != idaapi.BADNODE:
+            self.__ordinal_counts[ordinal] = self.__node.altval(ordinal, self.ORDINAL_COUNTS_TAG)
+            ordinal = self.__node.altnext(ordinal, self.ORDINAL_COUNTS_TAG)
+
+        index = self.__node.altfirst(self.HASHES_TAG)
+        while index != idaapi.BADNODE:
+            self.__hashes[helper.from_node_index(index)] = self.__node.altval(index, self.HASHES_TAG)
+            index = self.__node.altnext(index, self.HASHES_TAG)
+        self.__import_legacy_storage()
 
     def close(self):
         self.save()
-        self.storage = None
-        self.__delete_items_helper = defaultdict(set)
+        self.__reset()
 
     def save(self):
-        if not settings.STORE_XREFS:
+        if self.__node is None or not (self.__dirty or self.__dirty_ordinals or self.__dirty_hashes):
             return
 
-        if self.storage:
-            helper.save_long_str_to_idb(self.ARRAY_NAME, json.dumps(self.storage))
+        t = time.time()
+        for func_offset, blob in self.__dirty.items():
+            if blob:
+                node = self.__get_function_node(func_offset, True)
+                node.setblob(blob, 0, self.XREFS_TAG)
+                ordinals = sorted(self.__function_ordinals[func_offset])
+                node.setblob(struct.pack("<{}I".format(len(ordinals)), *ordinals), 0, self.ORDINALS_TAG)
+                self.__node.altset(helper.to_node_index(func_offset), len(blob))
+                self.__node.altset(helper.to_node_index(func_offset), self.__entries[func_offset], self.ENTRIES_TAG)
+            else:
+                node = self.__get_function_node(func_offset)
+                if node:
+                    node.kill()
+                self.__node.altdel(helper.to_node_index(func_offset))
+                self.__node.altdel(helper.to_node_index(func_offset), self.ENTRIES_TAG)
+        for ordinal in self.__dirty_ordinals:
+            if ordinal in self.__ordinal_counts:
+                self.__node.altset(ordinal, self.__ordinal_counts[ordinal], self.ORDINAL_COUNTS_TAG)
+            else:
+                self.__node.altdel(ordinal, self.ORDINAL_COUNTS_TAG)
+        for func_offset in self.__dirty_hashes:
+            if func_offset in self.__hashes:
+                self.__node.altset(helper.to_node_index(func_offset), self.__hashes[func_offset], self.HASHES_TAG)
+            else:
+                self.__node.altdel(helper.to_node_index(func_offset), self.HASHES_TAG)
+        logger.debug("Xrefs of {} functions saved in {:.3f} seconds".format(len(self.__dirty), time.time() - t))
+        self.__dirty.clear()
+        self.__dirty_ordinals.clear()
+        self.__dirty_hashes.clear()
 
     def update(self, function_offset, data):
-        """ data - {ordinal : (code_offset, line, usage_type)} """
-        for ordinal, info in list(data.items()):
-            self.__update_ordinal_info(ordinal, function_offset, info)
+        """ data - {ordinal : {struct_offset: [(code_offset, line, usage_type)]}} """
+        t = time.time()
+        old_ordinals = self.__get_function_ordinals(function_offset)
+        new_ordinals = set(data.keys())
+        if not data and not old_ordinals:
+            return
 
-        deleted_ordinals = self.__delete_items_helper[function_offset].difference(list(data.keys()))
-        for ordinal in deleted_ordinals:
-            self.__remove_ordinal_info(ordinal, function_offset)
+        for ordinal in old_ordinals - new_ordinals:
+            count = self.__ordinal_counts.get(ordinal, 0) - 1
+            if count > 0:
+                self.__ordinal_counts[ordinal] = count
+            else:
+                self.__ordinal_counts.pop(ordinal, None)
+            self.__dirty_ordinals.add(ordinal)
+        for ordinal in new_ordinals - old_ordinals:
+            self.__ordinal_counts[ordinal] = self.__ordinal_counts.get(ordinal, 0) + 1
+            self.__dirty_ordinals.add(ordinal)
 
-    def get_structure_info(self, ordinal, struct_offset):
-        """ By given ordinal and offset within a structure returns dictionary {func_address -> list(offsets)} """
-        result = []
+        if self.__ordinal_functions is not None:
+            old_data = self.__functions.get(function_offset, {})
+            for ordinal in old_ordinals - new_ordinals:
+                self.__remove_ordinal_info(ordinal, function_offset, old_data.get(ordinal, {}))
+            for ordinal in new_ordinals:
+                self.__update_ordinal_info(ordinal, function_offset, old_data.get(ordinal, {}), data[ordinal])
+
+        blob = encode_function_xrefs(data) if data else None
+        self.__size += (len(blob) if blob else 0) - self.__sizes.pop(function_offset, 0)
+        if blob:
+            self.__sizes[function_offset] = len(blob)
+        entries = sum(len(xrefs) for fields in data.values() for xrefs in fields.values())
+        self.__entry_count += entries - self.__entries.pop(function_offset, 0)
+        if blob:
+            self.__entries[function_offset] = entries
+        self.__functions[function_offset] = data
+        self.__function_ordinals[function_offset] = new_ordinals
+        self.__dirty[function_offset] = blob
+        self.__last_update_time = time.time() - t
+
+    def set_function_hash(self, function_offset, function_hash):
+        """ Remembers hash of the function which xrefs have just been collected """
+        if self.__hashes.get(function_offset) != function_hash:
+            self.__hashes[function_offset] = function_hash
+            self.__dirty_hashes.add(function_offset)
+
+    def reset_function_hash(self, function_offset):
+        """ Xrefs of the function may be out of date, so it will be visited when building the index """
+        if self.__hashes.pop(function_offset, None) is not None:
+            self.__dirty_hashes.add(function_offset)
+
+    def is_function_fresh(self, function_offset, function_hash):
+        """ Returns True if xrefs were collected when function had the same hash """
+        return self.__hashes.get(function_offset) == function_hash
+
+    def stats(self):
+        """ Returns XrefStorageStats. Counters are maintained by `update` so this is cheap """
+        return XrefStorageStats(
+            entries=self.__entry_count,
+            functions=len(self.__sizes),
+            ordinals=len(self.__ordinal_counts),
+            bytes=self.__size,
+            last_update_time=self.__last_update_time
+        )
 
-        if ordinal not in self.storage:
-            return result
+    def get_structure_info(self, ordinal, struct_offset):
+        """ By given ordinal and offset within a structure returns list of XrefInfo """
+        field_functions = self.__get_field_functions(ordinal)
+        return self.__get_field_xrefs(ordinal, struct_offset, field_functions.get(struct_offset, ()))
 
-        for func_offset, info in list(self.storage[ordinal].items()):
-            if struct_offset in info:
-                func_ea = func_offset + idaapi.get_imagebase()
-                for xref_info in info[struct_offset]:
-                    offset, line, usage_type = xref_info
-                    result.append(XrefInfo(func_ea, offset, line, usage_type))
+    def get_structure_range_info(self, ordinal, start, end):
+        """ Returns list of (struct_offset, XrefInfo) for all fields with offsets within [start, end) """
+        field_functions = self.__get_field_functions(ordinal)
+        field_offsets = self.__field_offsets[ordinal]
+        result = []
+        for idx in range(bisect.bisect_left(field_offsets, start), bisect.bisect_left(field_offsets, end)):
+            struct_offset = field_offsets[idx]
+            for xref_info in self.__get_field_xrefs(ordinal, struct_offset, field_functions[struct_offset]):
+                result.append((struct_offset, xref_info))
         return result
 
     @staticmethod
@@ -91,19 +308,139 @@ class XrefStorage(object):
         return x
 
     def __len__(self):
-        return len(str(self.storage))
-
-    def __init_delete_helper(self):
-        for ordinal, data in list(self.storage.items()):
-            for func_offset in data:
-                self.__delete_items_helper[func_offset].add(ordinal)
-
-    def __remove_ordinal_info(self, ordinal, function_offset):
-        del self.storage[ordinal][function_offset]
-        self.__delete_items_helper[function_offset].remove(ordinal)
-
-    def __update_ordinal_info(self, ordinal, function_offset, info):
-        if ordinal not in self.storage:
-            self.storage[ordinal] = {}
-        self.storage[ordinal][function_offset] = info
-        self.__delete_items_helper[function_offset].add(ordinal)
+        """ Size of all stored xrefs in bytes """
+        return self.__size
+
+    def __reset(self):
+        self.__node = None
+        self.__sizes = {}
+        self.__size = 0
+        self.__entries = {}
+        self.__entry_count = 0
+        self.__ordinal_counts = {}
+        self.__hashes = {}
+        self.__last_update_time = 0.0
+        self.__functions = {}
+        self.__function_ordinals = {}
+        self.__ordinal_functions = None
+        self.__field_functions = {}
+        self.__field_offsets = {}
+        self.__dirty = {}
+        self.__dirty_ordinals = set()
+        self.__dirty_hashes = set()
+
+    def __import_legacy_storage(self):
+        """ Older versions kept all xrefs as one JSON string """
+        legacy_data = helper.load_long_str_from_idb(self.LEGACY_ARRAY_NAME)
+        if legacy_data is None:
+            return
+
+        try:
+            storage = json.loads(legacy_data, object_hook=self.json_keys_to_str)
+        except ValueError:
+            logger.error("Failed to read previous info about Xrefs. Try Ctrl+F5 to cache data")
+            storage = {}
+
+        functions = defaultdict(dict)
+        for ordinal, data in storage.items():
+            for func_offset, info in data.items():
+                functions[func_offset][ordinal] = info
+        for func_offset, data in functions.items():
+            self.update(func_offset, data)
+        self.save()
+        idc.delete_array(idc.get_array_id(self.LEGACY_ARRAY_NAME))
+        logger.info("Xrefs of {} functions have been converted to the new format".format(len(functions)))
+
+    def __get_function_node(self, func_offset, create=False):
+        node = idaapi.netnode("{}{:X}".format(self.FUNCTION_NODE_PREFIX, helper.to_node_index(func_offset)), 0, create)
+        if node.index() == idaapi.BADNODE:
+            return None
+        return node
+
+    def __get_function_xrefs(self, func_offset):
+        if func_offset not in self.__functions:
+            result = {}
+            node = self.__get_function_node(func_offset) if self.__node is not None else None
+            blob = node.getblob(0, self.XREFS_TAG) if node else None
+            if blob:
+                try:
+                    result = decode_function_xrefs(blob)
+                except (ValueError, struct.error):
+                    logger.error("Failed to read xrefs of function at {}".format(
+                        helper.to_hex(func_offset + idaapi.get_imagebase())))
+            self.__functions[func_offset] = result
+        return self.__functions[func_offset]
+
+    def __get_function_ordinals(self, func_offset):
+        if func_offset not in self.__function_ordinals:
+            result = set()
+            if func_offset in self.__sizes and self.__node is not None:
+                node = self.__get_function_node(func_offset)
+                blob = node.getblob(0, self.ORDINALS_TAG) if node else None
+                if blob:
+                    result = set(struct.unpack("<{}I".format(len(blob) // 4), blob))
+            self.__function_ordinals[func_offset] = result
+        return self.__function_ordinals[func_offset]
+
+    def __get_ordinal_functions(self, ordinal):
+        if self.__ordinal_functions is None:
+            self.__ordinal_functions = defaultdict(set)
+            for func_offset in self.__sizes:
+                for function_ordinal in self.__get_function_ordinals(func_offset):
+                    self.__ordinal_functions[function_ordinal].add(func_offset)
+        return self.__ordinal_functions.get(ordinal, ())
+
+    def __get_field_functions(self, ordinal):
+        if ordinal not in self.__field_functions:
+            field_functions = defaultdict(list)
+            for func_offset in self.__get_ordinal_functions(ordinal):
+                for struct_offset in self.__get_function_xrefs(func_offset).get(ordinal, {}):
+                    field_functions[struct_offset].append(func_offset)
+            for func_offsets in field_functions.values():
+                func_offsets.sort()
+            self.__field_functions[ordinal] = field_functions
+            self.__field_offsets[ordinal] = sorted(field_functions)
+        return self.__field_functions[ordinal]
+
+    def __get_field_xrefs(self, ordinal, struct_offset, func_offsets):
+        result = []
+        image_base = idaapi.get_imagebase()
+        for func_offset in func_offsets:
+            func_ea = func_offset + image_base
+            for offset, line, usage_type in self.__functions[func_offset][ordinal][struct_offset]:
+                result.append(XrefInfo(func_ea, offset, line, usage_type))
+        return result
+
+    def __remove_ordinal_info(self, ordinal, function_offset, old_fields):
+        self.__ordinal_functions[ordinal].discard(function_offset)
+        if ordinal in self.__field_functions:
+            for struct_offset in old_fields:
+                self.__remove_field_function(ordinal, struct_offset, function_offset)
+
+    def __update_ordinal_info(self, ordinal, function_offset, old_fields, new_fields):
+        self.__ordinal_functions[ordinal].add(function_offset)
+        if ordinal in self.__field_functions:
+            for struct_offset in old_fields:
+                if struct_offset not in new_fields:
+                    self.__remove_field_function(ordinal, struct_offset, function_offset)
+            for struct_offset in new_fields:
+                if struct_offset not in old_fields:
+                    self.__add_field_function(ordinal, struct_offset, function_offset)
+
+    def __add_field_function(self, ordinal, struct_offset, function_offset):
+        func_offsets = self.__field_functions[ordinal][struct_offset]
+        if not func_offsets:
+            bisect.insort(self.__field_offsets[ordinal], struct_offset)
+        bisect.insort(func_offsets, function_offset)
+
+    def __remove_field_function(self, ordinal, struct_offset, function_offset):
+        func_offsets = self.__field_functions[ordinal].get(struct_offset)
+        if not func_offsets:
+            return
+        idx = bisect.bisect_left(func_offsets, function_offset)
+        if idx < len(func_offsets) and func_offsets[idx] == function_offset:
+            del func_offsets[idx]
+        if not func_offsets:
+            del self.__field_functions[ordinal][struct_offset]
+            field_offsets = self.__field_offsets[ordinal]
+            del field_offsets[bisect.bisect_left(field_offsets, struct_offset)]
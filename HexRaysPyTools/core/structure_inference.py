@@ -0,0 +1,137 @@
+import collections
+import logging
+
+import idaapi
+import idautils
+
+import HexRaysPyTools.api as api
+import HexRaysPyTools.settings as settings
+from . import helper
+from .temporary_structure import TemporaryStructure, VirtualTable
+from .touch_pipeline import TouchPipeline
+from .variable_scanner import NewDeepSearchVisitor
+from .work_queue import WorkQueue
+
+logger = logging.getLogger(__name__)
+
+
+class InferredStructure(object):
+    """ Candidate structure reconstructed from several seeds which are believed to have the same type """
+
+    def __init__(self, seeds, structure):
+        self.seeds = seeds              # [(func_ea, arg_idx)]
+        self.structure = structure      # TemporaryStructure
+
+    @property
+    def name(self):
+        name = self.structure.get_name()
+        if name == TemporaryStructure.default_name:
+            return "struct_{:X}".format(self.seeds[0][0])
+        return name
+
+
+class _DisjointSet(object):
+    def __init__(self, size):
+        self.__parents = list(range(size))
+
+    def find(self, item):
+        root = item
+        while self.__parents[root] != root:
+            root = self.__parents[root]
+        while self.__parents[item] != root:
+            self.__parents[item], item = root, self.__parents[item]
+        return root
+
+    def union(self, first, second):
+        self.__parents[self.find(first)] = self.find(second)
+
+
+def scan_seed(func_ea, arg_idx, structure):
+    """
+    Deep scans argument of the function adding found members to structure.
+
+    :return: set of (func_ea, arg_idx) through which the argument has flowed or None if it can't be scanned
+    """
+    cfunc = helper.decompile_function(func_ea)
+    if cfunc is None:
+        return None
+    if TouchPipeline(cfunc.entry_ea).process():
+        cfunc = helper.decompile_function(func_ea)
+
+    if arg_idx >= len(cfunc.arguments):
+        logger.warning("Function at {} has only {} arguments".format(helper.to_hex(func_ea), len(cfunc.arguments)))
+        return None
+    obj = api.VariableObject(cfunc.get_lvars()[arg_idx], arg_idx)
+    if not helper.is_legal_type(obj.tinfo):
+        logger.warning("Argument {} of function at {} has type {} that can't be scanned".format(
+            arg_idx, helper.to_hex(func_ea), obj.tinfo.dstr()))
+        return None
+    visitor = NewDeepSearchVisitor(cfunc, 0, obj, structure)
+    visitor.process()
+    return visitor.visited | {(cfunc.entry_ea, arg_idx)}
+
+
+def get_first_argument_seeds():
+    """ Returns seeds made of the first argument of every function which is known to have one of scannable type """
+    seeds = []
+    tinfo = idaapi.tinfo_t()
+    for func_ea in idautils.Functions():
+        func = idaapi.get_func(func_ea)
+        if func.flags & (idaapi.FUNC_THUNK | idaapi.FUNC_LIB) or helper.is_imported_ea(func_ea):
+            continue
+        if not idaapi.get_tinfo(tinfo, func_ea) and idaapi.guess_tinfo(tinfo, func_ea) != idaapi.GUESS_FUNC_OK:
+            continue
+        if tinfo.is_func() and tinfo.get_nargs() > 0 and helper.is_legal_type(tinfo.get_nth_arg(0)):
+            seeds.append((func_ea, 0))
+    return seeds
+
+
+def infer_structures(seeds):
+    """
+    Scans every seed into its own structure and then merges structures of seeds which have the same type: those
+    through which the same function arguments were reached and those having the same virtual table.
+
+    :param seeds: list of (func_ea, arg_idx)
+    :return: list of InferredStructure, the ones made of more seeds go first
+    """
+    scans = []      # [(seed, TemporaryStructure, visited)]
+
+    def scan(seed):
+        structure = TemporaryStructure()
+        visited = scan_seed(seed[0], seed[1], structure)
+        if visited is not None and structure.items:
+            scans.append((seed, structure, visited))
+
+    queue = WorkQueue("Inferring structures", seeds, lambda seed: idaapi.get_short_name(seed[0]))
+    if not queue.run(scan):
+        logger.warning("Inferring structures has been cancelled, {} of {} seeds are scanned".format(
+            queue.processed, len(seeds)))
+
+    links = collections.defaultdict(list)   # {(func_ea, arg_idx) or vtable address: [indices of scans]}
+    for idx, (_, structure, visited) in enumerate(scans):
+        for node in visited:
+            links[node].append(idx)
+        for member in structure.items:
+            if isinstance(member, VirtualTable):
+                links[member.address].append(idx)
+
+    disjoint_set = _DisjointSet(len(scans))
+    for key, indices in links.items():
+        if len(indices) > settings.INFER_MAX_SEEDS_PER_LINK:
+            # Generic helper or virtual table of a base class, it doesn't tell that these seeds have the same type
+            continue
+        for idx in indices[1:]:
+            disjoint_set.union(indices[0], idx)
+
+    clusters = collections.defaultdict(list)
+    for idx in range(len(scans)):
+        clusters[disjoint_set.find(idx)].append(idx)
+
+    result = []
+    for indices in clusters.values():
+        structure = TemporaryStructure()
+        structure.add_rows(member for idx in indices for member in scans[idx][1].items)
+        result.append(InferredStructure([scans[idx][0] for idx in indices], structure))
+    result.sort(key=lambda x: len(x.seeds), reverse=True)
+    logger.info("{} structures are inferred from {} seeds".format(len(result), len(scans)))
+    return result
@@ -0,0 +1,91 @@
+import collections
+
+from .temporary_structure import TemporaryStructure
+
+
+class StructureRegistry(object):
+    """
+    Named structures being reconstructed. Scanners add members to the active one, Structure Builder shows it and
+    switches between them. There's always at least one structure, so `active` never returns None.
+    """
+    DEFAULT_NAME = "Default"
+
+    def __init__(self):
+        self.__structures = collections.OrderedDict()     # {name: TemporaryStructure}
+        self.__active_name = None
+        self.__listeners = []
+        self.clear()
+
+    def add_listener(self, listener):
+        """ Listener is called without arguments when structures are added, removed or another one is activated """
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.__listeners.remove(listener)
+
+    @property
+    def active(self):
+        return self.__structures[self.__active_name]
+
+    @property
+    def active_name(self):
+        return self.__active_name
+
+    def names(self):
+        return list(self.__structures)
+
+    def get(self, name):
+        return self.__structures.get(name)
+
+    def add(self, name, structure=None, activate=True):
+        """
+        Registers structure under given name, suffix is appended if the name is taken.
+
+        :param name: str
+        :param structure: TemporaryStructure, empty one is created if not given
+        :param activate: whether new structure becomes the target of scans
+        :return: name under which structure is registered
+        """
+        unique_name, idx = name, 1
+        while unique_name in self.__structures:
+            unique_name = "{}_{}".format(name, idx)
+            idx += 1
+        self.__structures[unique_name] = structure if structure is not None else TemporaryStructure()
+        if activate:
+            self.__active_name = unique_name
+        self.__changed()
+        return unique_name
+
+    def select(self, name):
+        if name in self.__structures and name != self.__active_name:
+            self.__active_name = name
+            self.__changed()
+
+    def remove(self, name):
+        if name not in self.__structures:
+            return
+        del self.__structures[name]
+        if not self.__structures:
+            self.__structures[self.DEFAULT_NAME] = TemporaryStructure()
+        if name == self.__active_name:
+            self.__active_name = next(iter(self.__structures))
+        self.__changed()
+
+    def clear(self):
+        self.__structures.clear()
+        self.__structures[self.DEFAULT_NAME] = TemporaryStructure()
+        self.__active_name = self.DEFAULT_NAME
+        self.__changed()
+
+    def __changed(self):
+        for listener in self.__listeners:
+            listener()
+
+    def __len__(self):
+        return len(self.__structures)
+
+    def __contains__(self, name):
+        return name in self.__structures
+
+
+structure_registry = StructureRegistry()
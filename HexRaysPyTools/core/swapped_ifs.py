@@ -0,0 +1,96 @@
+import logging
+import struct
+
+import idaapi
+import idautils
+import idc
+
+logger = logging.getLogger(__name__)
+
+# All functions with swapped THEN-ELSE branches are stored in one blob as records of function RVA, number of IFs and
+# offsets of IFs from the function start. RVAs are signed because functions can lie below the image base, offsets
+# because chunks of the function can precede its entry
+SWAPPED_IFS_NODE_NAME = "$HexRaysPyTools:SwappedIfs"
+_FUNCTION_RECORD = "<qI"
+_IF_RECORD = "<i"
+
+# Previously every function had its own array named by function RVA with space separated RVAs of IFs
+_ARRAY_STORAGE_PREFIX = "$HexRaysPyTools:IfThenElse:"
+
+# {function RVA: set(offsets of IFs from function start)}
+_swapped_ifs = {}
+
+
+def load():
+    """ Reads swapped IFs from database, must be called when database is opened """
+    _swapped_ifs.clear()
+    node = idaapi.netnode(SWAPPED_IFS_NODE_NAME, 0, False)
+    if node.index() == idaapi.BADNODE:
+        _migrate_arrays()
+        return
+
+    blob = node.getblob(0, 'B') or b""
+    function_record_size = struct.calcsize(_FUNCTION_RECORD)
+    if_record_size = struct.calcsize(_IF_RECORD)
+    position = 0
+    while position + function_record_size <= len(blob):
+        func_rva, count = struct.unpack_from(_FUNCTION_RECORD, blob, position)
+        position += function_record_size
+        _swapped_ifs[func_rva] = set(
+            struct.unpack_from(_IF_RECORD, blob, position + idx * if_record_size)[0] for idx in range(count))
+        position += count * if_record_size
+
+
+def has_inverted(func_ea):
+    # Find if function has any swapped THEN-ELSE branches
+    return func_ea - idaapi.get_imagebase() in _swapped_ifs
+
+
+def get_inverted(func_ea):
+    # Returns set of addresses of swapped IFs
+    return set(func_ea + offset for offset in _swapped_ifs.get(func_ea - idaapi.get_imagebase(), ()))
+
+
+def invert(func_ea, if_ea):
+    # Store information about swaps (affected through actions). Swapping the same IF twice restores it
+    func_rva = func_ea - idaapi.get_imagebase()
+    offsets = _swapped_ifs.setdefault(func_rva, set())
+    offset = if_ea - func_ea
+    if offset in offsets:
+        offsets.remove(offset)
+        if not offsets:
+            del _swapped_ifs[func_rva]
+    else:
+        offsets.add(offset)
+    _save()
+
+
+def _save():
+    chunks = []
+    for func_rva, offsets in sorted(_swapped_ifs.items()):
+        chunks.append(struct.pack(_FUNCTION_RECORD, func_rva, len(offsets)))
+        chunks.extend(struct.pack(_IF_RECORD, offset) for offset in sorted(offsets))
+    node = idaapi.netnode(SWAPPED_IFS_NODE_NAME, 0, True)
+    node.setblob(b"".join(chunks), 0, 'B')
+
+
+def _migrate_arrays():
+    """ Moves swapped IFs from arrays of previous versions to the blob and deletes arrays """
+    image_base = idaapi.get_imagebase()
+    migrated = 0
+    for func_ea in idautils.Functions():
+        func_rva = func_ea - image_base
+        # Name is made exactly as previous versions did
+        array_id = idc.get_array_id(_ARRAY_STORAGE_PREFIX + hex(int(func_rva)))
+        if array_id == -1:
+            continue
+        array = idc.get_array_element(idc.AR_STR, array_id, 0)
+        if array:
+            _swapped_ifs[func_rva] = set(int(rva) - func_rva for rva in array.split())
+            migrated += 1
+        idc.delete_array(array_id)
+
+    # Node is created only after migration, so arrays are not searched again on the next opening
+    _save()
+    if migrated:
+        logger.info("Swapped IFs of {} functions have been moved to new storage".format(migrated))
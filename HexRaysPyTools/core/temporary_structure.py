@@ -1,6 +1,7 @@
 import bisect
+import collections
+import contextlib
 import itertools
-from PyQt5 import QtCore, QtGui, QtWidgets
 
 import idaapi
 import idc
@@ -8,8 +9,10 @@ import idc
 from . import common
 from . import const
 from . import helper
+from .interval_tree import IntervalTree
+from .type_shapes import type_shape_index, VTABLE_SIGNATURE
+from .touch_pipeline import TouchPipeline
 import HexRaysPyTools.api as api
-from HexRaysPyTools.forms import MyChoose
 
 
 SCORE_TABLE = dict((v, k) for k, v in enumerate(
@@ -21,6 +24,31 @@ SCORE_TABLE = dict((v, k) for k, v in enumerate(
 ))
 
 
+# When more rows are changed at once, indices of the structure are rebuilt instead of being updated for every row
+REBUILD_INDICES_THRESHOLD = 64
+
+# Members of the same type share one tinfo_t, keyed by its serialized form. See `intern_tinfo`
+_tinfo_pool = {}
+
+
+def intern_tinfo(tinfo):
+    """
+    Returns shared copy of tinfo. Deep scan creates a lot of members of a handful of types, so keeping one tinfo_t per
+    type saves memory. Returned object must not be modified in place
+    """
+    serialized = tinfo.serialize()
+    if not serialized:
+        return tinfo
+    interned = _tinfo_pool.get(serialized)
+    if interned is None:
+        interned = _tinfo_pool[serialized] = idaapi.tinfo_t(tinfo)
+    return interned
+
+
+def clear_tinfo_pool():
+    _tinfo_pool.clear()
+
+
 def parse_vtable_name(address):
     name = idaapi.get_name(address)
     if idaapi.is_valid_typename(name):
@@ -36,7 +64,9 @@ def parse_vtable_name(address):
     return common.demangled_name_to_c_str(name).replace("const_", "").replace("::_vftable", "_vtbl"), True
 
 
-class AbstractMember:
+class AbstractMember(object):
+    __slots__ = ('offset', 'origin', 'enabled', 'is_array', 'scanned_variables', 'usages', '_tinfo', '_type_name')
+
     def __init__(self, offset, scanned_variable, origin):
         """
         Offset is the very very base of the structure
@@ -44,6 +74,9 @@ class AbstractMember:
         scanned_variable - information about context in which this variable was scanned. This is necessary for final
         applying type after packing or finalizing structure.
 
+        usages - how many times the same candidate has been found, finding it again through the same scanned variable
+        doesn't count
+
         :param offset: int
         :param scanned_variable: ScannedVariable
         :param origin: int
@@ -53,8 +86,18 @@ class AbstractMember:
         self.enabled = True
         self.is_array = False
         self.scanned_variables = {scanned_variable} if scanned_variable else set()
+        self.usages = 1
         self.tinfo = None
 
+    @property
+    def tinfo(self):
+        return self._tinfo
+
+    @tinfo.setter
+    def tinfo(self, tinfo):
+        self._tinfo = tinfo
+        self._type_name = None
+
     def type_equals_to(self, tinfo):
         return self.tinfo.equals_to(tinfo)
 
@@ -80,39 +123,58 @@ class AbstractMember:
             return SCORE_TABLE[self.type_name]
         except KeyError:
             if self.tinfo and self.tinfo.is_funcptr():
-                return 0x1000 + len(self.tinfo.dstr())
+                return 0x1000 + len(self.type_name)
             return 0xFFFF
 
     @property
     def type_name(self):
+        """ Printed type is used for sorting, scoring and showing members, so it's calculated once per tinfo """
+        if self._type_name is None:
+            self._type_name = self._get_type_name()
+        return self._type_name
+
+    def _get_type_name(self):
         return self.tinfo.dstr()
 
+    @property
+    def key(self):
+        """ Members with the same key are the same candidate found several times """
+        return self.offset, self.type_name
+
+    def merge(self, other):
+        """ Takes into account that the same candidate was found one more time """
+        if other.scanned_variables:
+            new_variables = other.scanned_variables - self.scanned_variables
+            self.scanned_variables |= new_variables
+            self.usages += len(new_variables)
+        else:
+            self.usages += other.usages
+
+    @property
+    def shape_signature(self):
+        """
+        Used to narrow down structures with the same layout, see `type_shapes.TypeShape`. Size doesn't change when
+        typedefs are resolved, so candidates are then confirmed with `type_equals_to`
+        """
+        return self.tinfo.get_size()
+
     @property
     def size(self):
         size = self.tinfo.get_size()
         return size if size != idaapi.BADSIZE else 1
 
-    @property
-    def font(self):
-        return None
-
     def __repr__(self):
         return hex(self.offset) + ' ' + self.type_name
 
     def __eq__(self, other):
-        """ I'm aware that it's dirty but have no time to refactor whole file to nice one """
-
-        if self.offset == other.offset and self.type_name == other.type_name:
-            self.scanned_variables |= other.scanned_variables
-            return True
-        return False
+        return self.offset == other.offset and self.type_name == other.type_name
 
     __ne__ = lambda self, other: self.offset != other.offset or self.type_name != other.type_name
     __lt__ = lambda self, other: self.offset < other.offset or \
                                  (self.offset == other.offset and self.type_name < other.type_name)
     __le__ = lambda self, other: self.offset <= other.offset
     __gt__ = lambda self, other: self.offset > other.offset or \
-                                 (self.offset == other.offset and self.type_name < other.type_name)
+                                 (self.offset == other.offset and self.type_name > other.type_name)
     __ge__ = lambda self, other: self.offset >= other.offset
 
 
@@ -149,14 +211,9 @@ class VirtualFunction:
 
     @property
     def tinfo(self):
-        try:
-            decompiled_function = idaapi.decompile(self.address)
-            if decompiled_function and decompiled_function.type:
-                return idaapi.tinfo_t(decompiled_function.type)
-            return const.DUMMY_FUNC
-        except idaapi.DecompilationFailure:
-            pass
-        print("[ERROR] Failed to decompile function at 0x{0:08X}".format(self.address))
+        decompiled_function = helper.decompile_function(self.address)
+        if decompiled_function and decompiled_function.type:
+            return idaapi.tinfo_t(decompiled_function.type)
         return const.DUMMY_FUNC
 
     def show_location(self):
@@ -180,32 +237,7 @@ class ImportedVirtualFunction(VirtualFunction):
 
 
 class VirtualTable(AbstractMember):
-    class VirtualTableChoose(MyChoose):
-        def __init__(self, items, temp_struct, virtual_table):
-            MyChoose.__init__(
-                self,
-                items,
-                "Select Virtual Function",
-                [["Address", 10], ["Name", 15], ["Declaration", 45]],
-                13
-            )
-            self.popup_names = ["Scan All", "-", "Scan", "-"]
-            self.__temp_struct = temp_struct
-            self.__virtual_table = virtual_table
-
-        def OnGetLineAttr(self, n):
-            return [0xd9d9d9, 0x0] if self.__virtual_table.virtual_functions[n].visited else [0xffffff, 0x0]
-
-        def OnGetIcon(self, n):
-            return 32 if self.__virtual_table.virtual_functions[n].visited else 160
-
-        def OnInsertLine(self):
-            """ Scan All Functions menu """
-            self.__virtual_table.scan_virtual_functions()
-
-        def OnEditLine(self, n):
-            """ Scan menu """
-            self.__virtual_table.scan_virtual_function(n, self.__temp_struct)
+    __slots__ = ('address', 'virtual_functions', 'name', 'vtable_name', 'have_nice_name')
 
     def __init__(self, offset, address, scanned_variable=None, origin=0):
         AbstractMember.__init__(self, offset + origin, scanned_variable, origin)
@@ -281,7 +313,8 @@ class VirtualTable(AbstractMember):
             print("*" * 100)
 
     def show_virtual_functions(self, temp_struct):
-        function_chooser = self.VirtualTableChoose(
+        from HexRaysPyTools.forms import VirtualTableChoose
+        function_chooser = VirtualTableChoose(
             [function.get_information() for function in self.virtual_functions], temp_struct, self)
 
         idx = function_chooser.Show(True)
@@ -294,13 +327,11 @@ class VirtualTable(AbstractMember):
         if helper.is_imported_ea(self.virtual_functions[index].address):
             print("[INFO] Ignoring import function at 0x{0:08X}".format(self.address))
             return
-        try:
-            function = idaapi.decompile(self.virtual_functions[index].address)
-        except idaapi.DecompilationFailure:
-            print("[ERROR] Failed to decompile function at 0x{0:08X}".format(self.address))
+        function = helper.decompile_function(self.virtual_functions[index].address)
+        if not function:
             return
-        if helper.FunctionTouchVisitor(function).process():
-            function = idaapi.decompile(self.virtual_functions[index].address)
+        if TouchPipeline(function.entry_ea).process():
+            function = helper.decompile_function(self.virtual_functions[index].address)
         if function.arguments and function.arguments[0].is_arg_var and helper.is_legal_type(function.arguments[0].tif):
             from . import variable_scanner
             print("[Info] Scanning virtual function at 0x{0:08X}".format(function.entry_ea))
@@ -311,8 +342,9 @@ class VirtualTable(AbstractMember):
             print("[Warning] Bad type of first argument in virtual function at 0x{0:08X}".format(function.entry_ea))
 
     def scan_virtual_functions(self, temp_struct):
-        for idx in range(len(self.virtual_functions)):
-            self.scan_virtual_function(idx, temp_struct)
+        with temp_struct.bulk_update():
+            for idx in range(len(self.virtual_functions)):
+                self.scan_virtual_function(idx, temp_struct)
 
     def get_udt_member(self, offset=0):
         udt_member = idaapi.udt_member_t()
@@ -372,13 +404,12 @@ class VirtualTable(AbstractMember):
     def score(self):
         return 0x2000
 
-    @property
-    def type_name(self):
+    def _get_type_name(self):
         return self.vtable_name + " *"
 
     @property
-    def font(self):
-        return QtGui.QFont("Consolas", 10, QtGui.QFont.Bold)
+    def shape_signature(self):
+        return VTABLE_SIGNATURE
 
     @property
     def size(self):
@@ -386,9 +417,11 @@ class VirtualTable(AbstractMember):
 
 
 class Member(AbstractMember):
+    __slots__ = ('name',)
+
     def __init__(self, offset, tinfo, scanned_variable, origin=0):
         AbstractMember.__init__(self, offset + origin, scanned_variable, origin)
-        self.tinfo = tinfo
+        self.tinfo = intern_tinfo(tinfo)
         self.name = "field_{0:X}".format(self.offset)
 
     def get_udt_member(self, array_size=0, offset=0):
@@ -414,11 +447,13 @@ class Member(AbstractMember):
         _, tp, fld = result
         tinfo = idaapi.tinfo_t()
         tinfo.deserialize(idaapi.cvar.idati, tp, fld, None)
-        self.tinfo = tinfo
+        self.tinfo = intern_tinfo(tinfo)
         self.is_array = False
 
 
 class VoidMember(Member):
+    __slots__ = ()
+
     def __init__(self, offset, scanned_variable, origin=0, char=False):
         tinfo = const.CHAR_TINFO if char else const.BYTE_TINFO
         Member.__init__(self, offset, tinfo, scanned_variable, origin)
@@ -434,89 +469,51 @@ class VoidMember(Member):
         self.enabled = enable
 
     @property
-    def font(self):
-        return QtGui.QFont("Consolas", 10, italic=True)
+    def shape_signature(self):
+        # Matches any field
+        return None
 
 
-class TemporaryStructureModel(QtCore.QAbstractTableModel):
+class TemporaryStructure(object):
     default_name = "CHANGE_MY_NAME"
 
-    def __init__(self, *args):
+    def __init__(self):
         """
-        Keeps information about currently found fields in possible structure
+        Keeps information about currently found fields in possible structure. Doesn't depend on Qt, so structures
+        can be reconstructed in batch mode. Structure Builder shows it through `TemporaryStructureModel`
         main_offset - is the base from where variables scanned. Can be set to different value if some field is passed by
                       reverence
         items - array of candidates to fields
+        __members - {candidate's key: candidate}, finds the same candidate found again
+        __intervals - enabled candidates indexed by the space they occupy
+        __overlaps - {id(candidate): number of other enabled candidates it overlaps}, only for enabled candidates
         """
-        super(TemporaryStructureModel, self).__init__(*args)
         self.main_offset = 0
-        self.headers = ["Offset", "Type", "Name"]
         self.items = []
-        self.collisions = []
-
-    # OVERLOADED METHODS #
-
-    def rowCount(self, *args):
-        return len(self.items)
-
-    def columnCount(self, *args):
-        return len(self.headers)
-
-    def data(self, index, role):
-        row, col = index.row(), index.column()
-        item = self.items[row]
-        if role == QtCore.Qt.DisplayRole:
-            if col == 0:
-                return "0x{0:08X}".format(item.offset)
-            elif col == 1:
-                if item.is_array and item.size > 0:
-                    array_size = self.calculate_array_size(row)
-                    if array_size:
-                        return item.type_name + "[{}]".format(array_size)
-                return item.type_name
-            elif col == 2:
-                return item.name
-        elif role == QtCore.Qt.ToolTipRole:
-            if col == 0:
-                return self.items[row].offset
-            elif col == 1:
-                return self.items[row].size * (self.calculate_array_size(row) if self.items[row].is_array else 1)
-        elif role == QtCore.Qt.EditRole:
-            if col == 2:
-                return self.items[row].name
-        elif role == QtCore.Qt.FontRole:
-            if col == 1:
-                return item.font
-        elif role == QtCore.Qt.BackgroundRole:
-            if not item.enabled:
-                return QtGui.QColor(QtCore.Qt.gray)
-            if item.offset == self.main_offset:
-                if col == 0:
-                    return QtGui.QBrush(QtGui.QColor("#ff8080"))
-            if self.have_collision(row):
-                return QtGui.QBrush(QtGui.QColor("#ffff99"))
-        elif role == QtCore.Qt.ForegroundRole:
-            if self.have_collision(row):
-                return QtGui.QBrush(QtGui.QColor("#191919"))
-
-    def setData(self, index, value, role):
-        row, col = index.row(), index.column()
-        if role == QtCore.Qt.EditRole and idaapi.is_ident(str(value)):
-            self.items[row].name = str(value)
-            self.dataChanged.emit(index, index)
-            return True
-        return False
-
-    def headerData(self, section, orientation, role):
-        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
-            return self.headers[section]
-
-    def flags(self, index):
-        if index.column() == 2:
-            return super(TemporaryStructureModel, self).flags(index) | QtWidgets.QAbstractItemView.DoubleClicked
-        return super(TemporaryStructureModel, self).flags(index)
-
-    # HELPER METHODS #
+        self.__listeners = []
+        self.__members = {}
+        self.__intervals = IntervalTree()
+        self.__overlaps = {}
+        self.__bulk_update_depth = 0
+        self.__changed = False
+
+    def add_listener(self, listener):
+        """ Listener is called without arguments every time members are changed """
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.__listeners.remove(listener)
+
+    @contextlib.contextmanager
+    def bulk_update(self):
+        """ Listeners are notified only once after all changes made within this context. Can be nested """
+        self.__bulk_update_depth += 1
+        try:
+            yield
+        finally:
+            self.__bulk_update_depth -= 1
+            if not self.__bulk_update_depth and self.__changed:
+                self.__items_changed()
 
     def get_name(self):
         candidate_name = None
@@ -528,8 +525,9 @@ class TemporaryStructureModel(QtCore.QAbstractTableModel):
                 candidate_name = field.vtable_name.replace("_vtbl", "")
         return candidate_name if candidate_name else self.default_name
 
-    def pack(self, start=0, stop=None):
-        if self.collisions[start:stop].count(True):
+    def get_declaration(self, start=0, stop=None, name=None):
+        """ Returns C declaration of structure made of enabled members or None if there're collisions """
+        if self.has_collisions(start, stop):
             print("[Warning] Collisions detected")
             return
 
@@ -553,75 +551,96 @@ class TemporaryStructureModel(QtCore.QAbstractTableModel):
 
         final_tinfo.create_udt(udt_data, idaapi.BTF_STRUCT)
         cdecl = idaapi.print_tinfo(None, 4, 5, idaapi.PRTYPE_MULTI | idaapi.PRTYPE_TYPE | idaapi.PRTYPE_SEMI,
-                                   final_tinfo, self.get_name(), None)
-        cdecl = idaapi.ask_text(0x10000, '#pragma pack(push, 1)\n' + cdecl, "The following new type will be created")
-
-        if cdecl:
-            structure_name = idaapi.idc_parse_decl(idaapi.cvar.idati, cdecl, idaapi.PT_TYP)[0]
-            previous_ordinal = idaapi.get_type_ordinal(idaapi.cvar.idati, structure_name)
-
-            if previous_ordinal:
-                reply = QtWidgets.QMessageBox.question(
-                    None,
-                    "HexRaysPyTools",
-                    "Structure already exist. Do you want to overwrite it?",
-                    QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No
-                )
-                if reply == QtWidgets.QMessageBox.Yes:
-                    idaapi.del_numbered_type(idaapi.cvar.idati, previous_ordinal)
-                    ordinal = idaapi.idc_set_local_type(previous_ordinal, cdecl, idaapi.PT_TYP)
-                else:
-                    return
-            else:
-                ordinal = idaapi.idc_set_local_type(-1, cdecl, idaapi.PT_TYP)
-            if ordinal:
-                print("[Info] New type {0} was added to Local Types".format(structure_name))
-                tid = idaapi.import_type(idaapi.cvar.idati, -1, structure_name)
-                if tid:
-                    tinfo = idaapi.create_typedef(structure_name)
-                    ptr_tinfo = idaapi.tinfo_t()
-                    ptr_tinfo.create_ptr(tinfo)
-                    for scanned_var in self.get_unique_scanned_variables(origin):
-                        scanned_var.apply_type(ptr_tinfo)
-                    return tinfo
-            else:
-                print("[ERROR] Structure {0} probably already exist".format(structure_name))
+                                   final_tinfo, name or self.get_name(), None)
+        return '#pragma pack(push, 1)\n' + cdecl
+
+    @staticmethod
+    def import_declaration(cdecl, ask=True):
+        """ Adds structure to Local Types and returns its tinfo. Existing structure is replaced if user agrees """
+        structure_name = idaapi.idc_parse_decl(idaapi.cvar.idati, cdecl, idaapi.PT_TYP)[0]
+        previous_ordinal = idaapi.get_type_ordinal(idaapi.cvar.idati, structure_name)
+
+        if previous_ordinal:
+            if ask and idaapi.ask_yn(
+                    idaapi.ASKBTN_NO, "Structure already exist. Do you want to overwrite it?") != idaapi.ASKBTN_YES:
+                return
+            idaapi.del_numbered_type(idaapi.cvar.idati, previous_ordinal)
+            ordinal = idaapi.idc_set_local_type(previous_ordinal, cdecl, idaapi.PT_TYP)
+        else:
+            ordinal = idaapi.idc_set_local_type(-1, cdecl, idaapi.PT_TYP)
+        if ordinal:
+            print("[Info] New type {0} was added to Local Types".format(structure_name))
+            tid = idaapi.import_type(idaapi.cvar.idati, -1, structure_name)
+            if tid:
+                return idaapi.create_typedef(structure_name)
+        else:
+            print("[ERROR] Structure {0} probably already exist".format(structure_name))
+
+    def pack(self, start=0, stop=None):
+        cdecl = self.get_declaration(start, stop)
+        if cdecl is None:
+            return
+        cdecl = idaapi.ask_text(0x10000, cdecl, "The following new type will be created")
+        if not cdecl:
+            return
+
+        tinfo = self.import_declaration(cdecl)
+        if tinfo:
+            ptr_tinfo = idaapi.tinfo_t()
+            ptr_tinfo.create_ptr(tinfo)
+            origin = self.items[start].offset if start else 0
+            for scanned_var in self.get_unique_scanned_variables(origin):
+                scanned_var.apply_type(ptr_tinfo)
+            return tinfo
 
     def have_member(self, member):
-        if self.items:
-            idx = bisect.bisect_left(self.items, member)
-            if idx < self.rowCount():
-                return self.items[idx] == member
-        return False
+        return member.key in self.__members
 
     def have_collision(self, row):
-        return self.collisions[row]
+        return self.__overlaps.get(id(self.items[row]), 0) > 0
+
+    def has_collisions(self, start=0, stop=None):
+        return any(self.__overlaps.get(id(item), 0) for item in self.items[start:stop])
 
     def refresh_collisions(self):
-        self.collisions = [False for _ in range(len(self.items))]
-        if (len(self.items)) > 1:
-            curr = 0
-            while curr < len(self.items):
-                if self.items[curr].enabled:
-                    break
-                curr += 1
-            next = curr + 1
-            while next < len(self.items):
-                if self.items[next].enabled:
-                    if self.items[curr].offset + self.items[curr].size > self.items[next].offset:
-                        self.collisions[curr] = True
-                        self.collisions[next] = True
-                        if self.items[curr].offset + self.items[curr].size < self.items[next].offset + self.items[next].size:
-                            curr = next
-                    else:
-                        curr = next
-                next += 1
+        """ Rebuilds indices from scratch. Needed only if members were changed bypassing the methods of this class """
+        self.__members.clear()
+        self.__intervals.clear()
+        self.__overlaps.clear()
+        for item in self.items:
+            self.__members.setdefault(item.key, item)
+            if item.enabled:
+                self.__add_to_index(item)
 
     def add_row(self, member):
-        if not self.have_member(member):
-            bisect.insort(self.items, member)
-            self.refresh_collisions()
-            self.modelReset.emit()
+        """ Adds new candidate or merges it with the same one that was found earlier """
+        existing = self.__members.get(member.key)
+        if existing is not None:
+            existing.merge(member)
+            return
+        self.__members[member.key] = member
+        bisect.insort_left(self.items, member)
+        if member.enabled:
+            self.__add_to_index(member)
+        self.__items_changed()
+
+    def add_rows(self, members):
+        """ Adds many members at once, sorting them only one time """
+        new_members = []
+        for member in members:
+            existing = self.__members.get(member.key)
+            if existing is not None:
+                existing.merge(member)
+                continue
+            self.__members[member.key] = member
+            new_members.append(member)
+        if new_members:
+            self.items.extend(new_members)
+            self.items.sort()
+            for member in new_members:
+                if member.enabled:
+                    self.__add_to_index(member)
+            self.__items_changed()
 
     def get_unique_scanned_variables(self, origin=0):
         scan_objects = itertools.chain.from_iterable(
@@ -630,7 +649,7 @@ class TemporaryStructureModel(QtCore.QAbstractTableModel):
 
     def get_next_enabled(self, row):
         row += 1
-        while row < self.rowCount():
+        while row < len(self.items):
             if self.items[row].enabled:
                 return row
             row += 1
@@ -643,6 +662,8 @@ class TemporaryStructureModel(QtCore.QAbstractTableModel):
         return 0
 
     def get_recognized_shape(self, start=0, stop=-1):
+        from HexRaysPyTools.forms import MyChoose
+
         if not self.items:
             return None
         result = []
@@ -652,30 +673,25 @@ class TemporaryStructureModel(QtCore.QAbstractTableModel):
         else:
             base = 0
             enabled_items = [x for x in self.items if x.enabled]
-        offsets = set([x.offset for x in enabled_items])
         if not enabled_items:
             return
         min_size = enabled_items[-1].offset + enabled_items[-1].size - base
-        tinfo = idaapi.tinfo_t()
-        for ordinal in range(1, idaapi.get_ordinal_qty(idaapi.cvar.idati)):
+        requirements = collections.defaultdict(set)
+        for item in enabled_items:
+            requirements[item.offset - base].add(item.shape_signature)
+        offsets = set(requirements)
+        for ordinal in type_shape_index.find(requirements, min_size):
+            tinfo = idaapi.tinfo_t()
             tinfo.get_numbered_type(idaapi.cvar.idati, ordinal)
-            if tinfo.is_udt() and tinfo.get_size() >= min_size:
-                is_found = False
-                for offset in offsets:
-                    is_found = False
-                    items = [x for x in enabled_items if x.offset == offset]
-                    potential_members = helper.get_fields_at_offset(tinfo, offset - base)
-                    for item in items:
-                        for potential_member in potential_members:
-                            if item.type_equals_to(potential_member):
-                                is_found = True
-                                break
-                        if is_found:
-                            break
-                    if not is_found:
-                        break
-                if is_found:
-                    result.append((ordinal, idaapi.tinfo_t(tinfo)))
+            is_found = False
+            for offset in offsets:
+                items = [x for x in enabled_items if x.offset - base == offset]
+                potential_members = helper.get_fields_at_offset(tinfo, offset)
+                is_found = any(item.type_equals_to(x) for item in items for x in potential_members)
+                if not is_found:
+                    break
+            if is_found:
+                result.append((ordinal, tinfo))
         chooser = MyChoose(
             [[str(x), "0x{0:08X}".format(y.get_size()), y.dstr()] for x, y in result],
             "Select Structure",
@@ -686,56 +702,62 @@ class TemporaryStructureModel(QtCore.QAbstractTableModel):
             return result[idx][1]
         return None
 
-    # SLOTS #
-
     def finalize(self):
         if self.pack():
             self.clear()
 
-    def disable_rows(self, indices):
-        for idx in indices:
-            if self.items[idx.row()].enabled:
-                self.items[idx.row()].set_enabled(False)
-        self.refresh_collisions()
-        self.modelReset.emit()
+    def get_rows(self, start_offset, end_offset):
+        """ Returns rows of members beginning within [start_offset, end_offset), can be passed to bulk edits """
+        return range(self.__find_row(start_offset), self.__find_row(end_offset))
 
-    def enable_rows(self, indices):
-        for idx in indices:
-            if not self.items[idx.row()].enabled:
-                self.items[idx.row()].enabled = True
-        self.refresh_collisions()
-        self.modelReset.emit()
-
-    def set_origin(self, indices):
-        if indices:
-            self.main_offset = self.items[indices[0].row()].offset
-            self.modelReset.emit()
-
-    def make_array(self, indices):
-        if indices:
-            self.items[indices[0].row()].switch_array_flag()
-            self.dataChanged.emit(indices[0], indices[0])
-
-    def pack_substructure(self, indices):
-        if indices:
-            indices = sorted(indices)
-            self.dataChanged.emit(indices[0], indices[-1])
-            start, stop = indices[0].row(), indices[-1].row() + 1
-            tinfo = self.pack(start, stop)
-            if tinfo:
-                offset = self.items[start].offset
-                self.items = self.items[0:start] + self.items[stop:]
-                self.add_row(Member(offset, tinfo, None))
+    def disable_rows(self, rows):
+        members = [self.items[row] for row in set(rows) if self.items[row].enabled]
+        if len(members) > REBUILD_INDICES_THRESHOLD:
+            for member in members:
+                member.set_enabled(False)
+            self.refresh_collisions()
+        else:
+            for member in members:
+                self.__disable(member)
+        self.__items_changed()
+
+    def enable_rows(self, rows):
+        members = [self.items[row] for row in set(rows) if not self.items[row].enabled]
+        for member in members:
+            member.enabled = True
+        if len(members) > REBUILD_INDICES_THRESHOLD:
+            self.refresh_collisions()
+        else:
+            for member in members:
+                self.__add_to_index(member)
+        self.__items_changed()
 
-    def unpack_substructure(self, indices):
+    def set_origin(self, row):
+        self.main_offset = self.items[row].offset
+        self.__items_changed()
 
-        if indices is None or len(indices) != 1:
-            return
+    def make_array(self, row):
+        self.items[row].switch_array_flag()
 
-        item = self.items[indices[0].row()]
+    def activate_member(self, row):
+        """ Shows member specific dialog. Member's type can be changed there """
+        self.items[row].activate(self)
+        self.refresh_collisions()
+        self.__items_changed()
+
+    def pack_substructure(self, start, stop):
+        tinfo = self.pack(start, stop)
+        if tinfo:
+            offset = self.items[start].offset
+            with self.bulk_update():
+                self.remove_items(range(start, stop))
+                self.add_row(Member(offset, tinfo, None))
+
+    def unpack_substructure(self, row):
+        item = self.items[row]
         if item.tinfo is not None and item.tinfo.is_udt():
 
-            self.remove_items(indices)
+            self.remove_items([row])
             offset = item.offset
             udt_data = idaapi.udt_type_data_t()
             if item.tinfo.get_udt_details(udt_data):
@@ -745,8 +767,9 @@ class TemporaryStructureModel(QtCore.QAbstractTableModel):
                     self.add_row(member)
 
     def resolve_types(self):
+        """ Disables colliding candidates with less score, the one found more times wins among equally scored """
         current_item = None
-        current_item_score = 0
+        current_item_score = None
 
         for item in self.items:
             if not item.enabled:
@@ -754,40 +777,50 @@ class TemporaryStructureModel(QtCore.QAbstractTableModel):
 
             if current_item is None:
                 current_item = item
-                current_item_score = current_item.score
+                current_item_score = current_item.score, current_item.usages
                 continue
 
-            item_score = item.score
-            if current_item.has_collision(item):
+            item_score = item.score, item.usages
+            if self.__overlaps[id(item)] and current_item.has_collision(item):
                 if item_score <= current_item_score:
-                    item.set_enabled(False)
+                    self.__disable(item)
                     continue
                 elif item_score > current_item_score:
-                    current_item.set_enabled(False)
+                    self.__disable(current_item)
 
             current_item = item
             current_item_score = item_score
 
-        self.refresh_collisions()
-        self.modelReset.emit()
+        self.__items_changed()
 
-    def remove_items(self, indices):
-        rows = [x.row() for x in indices]
-        if rows:
-            self.items = [item for item in self.items if self.items.index(item) not in rows]
-            self.modelReset.emit()
+    def remove_items(self, rows):
+        """ Removes members at given rows in one pass over the structure """
+        rows = set(rows)
+        if not rows:
+            return
+        removed_members = [self.items[row] for row in rows]
+        self.items = [item for row, item in enumerate(self.items) if row not in rows]
+        if len(removed_members) > REBUILD_INDICES_THRESHOLD:
+            self.refresh_collisions()
+        else:
+            for member in removed_members:
+                if member.enabled:
+                    self.__remove_from_index(member)
+                if self.__members.get(member.key) is member:
+                    del self.__members[member.key]
+        self.__items_changed()
 
     def clear(self):
         self.items = []
         self.main_offset = 0
-        self.modelReset.emit()
-
-    def recognize_shape(self, indices):
-        min_idx = max_idx = None
-        if indices:
-            min_idx, max_idx = min(indices), max(indices, key=lambda x: (x.row(), x.column()))
-
-        if min_idx == max_idx:
+        self.__members.clear()
+        self.__intervals.clear()
+        self.__overlaps.clear()
+        self.__items_changed()
+
+    def recognize_shape(self, start=None, stop=None):
+        """ Looks for existing structure that matches either all members or members within [start, stop) rows """
+        if start is None:
             tinfo = self.get_recognized_shape()
             if tinfo:
                 tinfo.create_ptr(tinfo)
@@ -795,8 +828,6 @@ class TemporaryStructureModel(QtCore.QAbstractTableModel):
                     scanned_var.apply_type(tinfo)
                 self.clear()
         else:
-            # indices = sorted(indices)
-            start, stop = min_idx.row(), max_idx.row() + 1
             base = self.items[start].offset
             tinfo = self.get_recognized_shape(start, stop)
             if tinfo:
@@ -804,23 +835,42 @@ class TemporaryStructureModel(QtCore.QAbstractTableModel):
                 ptr_tinfo.create_ptr(tinfo)
                 for scanned_var in self.get_unique_scanned_variables(base):
                     scanned_var.apply_type(ptr_tinfo)
-                self.items = [x for x in self.items if x.offset < base or x.offset >= base + tinfo.get_size()]
-                self.add_row(Member(base, tinfo, None))
-
-    def activated(self, index):
-        # Double click on offset, opens window with variables
-        if index.column() == 0:
-            item = self.items[index.row()]
-            scanned_variables = list(item.scanned_variables)
-            variable_chooser = MyChoose(
-                [x.to_list() for x in scanned_variables],
-                "Select Variable",
-                [["Origin", 4], ["Function name", 25], ["Variable name", 25], ["Expression address", 10]]
-            )
-            row = variable_chooser.Show(modal=True)
-            if row != -1:
-                idaapi.open_pseudocode(scanned_variables[row].expression_address, 0)
-
-        # Double click on type. If type is virtual table than opens windows with virtual methods
-        elif index.column() == 1:
-            self.items[index.row()].activate(self)
+                with self.bulk_update():
+                    self.remove_items(self.get_rows(base, base + tinfo.get_size()))
+                    self.add_row(Member(base, tinfo, None))
+
+    def __find_row(self, offset):
+        """ Returns the first row with member at offset not less than given one """
+        low, high = 0, len(self.items)
+        while low < high:
+            middle = (low + high) // 2
+            if self.items[middle].offset < offset:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def __add_to_index(self, member):
+        colliding_members = self.__intervals.overlapping(member.offset, member.offset + member.size)
+        for other in colliding_members:
+            self.__overlaps[id(other)] += 1
+        self.__overlaps[id(member)] = len(colliding_members)
+        self.__intervals.add(member.offset, member.offset + member.size, member)
+
+    def __remove_from_index(self, member):
+        self.__intervals.remove(member.offset, member)
+        del self.__overlaps[id(member)]
+        for other in self.__intervals.overlapping(member.offset, member.offset + member.size):
+            self.__overlaps[id(other)] -= 1
+
+    def __disable(self, member):
+        self.__remove_from_index(member)
+        member.set_enabled(False)
+
+    def __items_changed(self):
+        if self.__bulk_update_depth:
+            self.__changed = True
+            return
+        self.__changed = False
+        for listener in self.__listeners:
+            listener()
@@ -0,0 +1,164 @@
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+import idaapi
+
+from .temporary_structure import VirtualTable, VoidMember
+from HexRaysPyTools.forms import MyChoose
+
+
+class TemporaryStructureModel(QtCore.QAbstractTableModel):
+    """ Shows TemporaryStructure in Structure Builder and translates selected indices to rows of the structure """
+
+    def __init__(self, structure, *args):
+        super(TemporaryStructureModel, self).__init__(*args)
+        self.structure = structure
+        self.headers = ["Offset", "Type", "Name"]
+        structure.add_listener(self.__reset)
+
+    def detach(self):
+        """ Stops following changes of the structure, must be called when the model isn't used anymore """
+        self.structure.remove_listener(self.__reset)
+
+    # OVERLOADED METHODS #
+
+    def rowCount(self, *args):
+        return len(self.structure.items)
+
+    def columnCount(self, *args):
+        return len(self.headers)
+
+    def data(self, index, role):
+        row, col = index.row(), index.column()
+        item = self.structure.items[row]
+        if role == QtCore.Qt.DisplayRole:
+            if col == 0:
+                return "0x{0:08X}".format(item.offset)
+            elif col == 1:
+                if item.is_array and item.size > 0:
+                    array_size = self.structure.calculate_array_size(row)
+                    if array_size:
+                        return item.type_name + "[{}]".format(array_size)
+                return item.type_name
+            elif col == 2:
+                return item.name
+        elif role == QtCore.Qt.ToolTipRole:
+            if col == 0:
+                return item.offset
+            elif col == 1:
+                return item.size * (self.structure.calculate_array_size(row) if item.is_array else 1)
+            elif col == 2:
+                return "Found {} times".format(item.usages)
+        elif role == QtCore.Qt.EditRole:
+            if col == 2:
+                return item.name
+        elif role == QtCore.Qt.FontRole:
+            if col == 1:
+                return self.__get_font(item)
+        elif role == QtCore.Qt.BackgroundRole:
+            if not item.enabled:
+                return QtGui.QColor(QtCore.Qt.gray)
+            if item.offset == self.structure.main_offset:
+                if col == 0:
+                    return QtGui.QBrush(QtGui.QColor("#ff8080"))
+            if self.structure.have_collision(row):
+                return QtGui.QBrush(QtGui.QColor("#ffff99"))
+        elif role == QtCore.Qt.ForegroundRole:
+            if self.structure.have_collision(row):
+                return QtGui.QBrush(QtGui.QColor("#191919"))
+
+    def setData(self, index, value, role):
+        row, col = index.row(), index.column()
+        if role == QtCore.Qt.EditRole and idaapi.is_ident(str(value)):
+            self.structure.items[row].name = str(value)
+            self.dataChanged.emit(index, index)
+            return True
+        return False
+
+    def headerData(self, section, orientation, role):
+        if role == QtCore.Qt.DisplayRole and orientation == QtCore.Qt.Horizontal:
+            return self.headers[section]
+
+    def flags(self, index):
+        if index.column() == 2:
+            return super(TemporaryStructureModel, self).flags(index) | QtWidgets.QAbstractItemView.DoubleClicked
+        return super(TemporaryStructureModel, self).flags(index)
+
+    # SLOTS #
+
+    def finalize(self):
+        self.structure.finalize()
+
+    def disable_rows(self, indices):
+        self.structure.disable_rows(set(idx.row() for idx in indices))
+
+    def enable_rows(self, indices):
+        self.structure.enable_rows(set(idx.row() for idx in indices))
+
+    def set_origin(self, indices):
+        if indices:
+            self.structure.set_origin(indices[0].row())
+
+    def make_array(self, indices):
+        if indices:
+            self.structure.make_array(indices[0].row())
+            self.dataChanged.emit(indices[0], indices[0])
+
+    def pack_substructure(self, indices):
+        if indices:
+            indices = sorted(indices)
+            self.dataChanged.emit(indices[0], indices[-1])
+            self.structure.pack_substructure(indices[0].row(), indices[-1].row() + 1)
+
+    def unpack_substructure(self, indices):
+        if indices is None or len(indices) != 1:
+            return
+        self.structure.unpack_substructure(indices[0].row())
+
+    def remove_items(self, indices):
+        self.structure.remove_items(idx.row() for idx in indices)
+
+    def resolve_types(self):
+        self.structure.resolve_types()
+
+    def clear(self):
+        self.structure.clear()
+
+    def recognize_shape(self, indices):
+        min_idx = max_idx = None
+        if indices:
+            min_idx, max_idx = min(indices), max(indices, key=lambda x: (x.row(), x.column()))
+
+        if min_idx == max_idx:
+            self.structure.recognize_shape()
+        else:
+            self.structure.recognize_shape(min_idx.row(), max_idx.row() + 1)
+
+    def activated(self, index):
+        # Double click on offset, opens window with variables
+        if index.column() == 0:
+            item = self.structure.items[index.row()]
+            scanned_variables = list(item.scanned_variables)
+            variable_chooser = MyChoose(
+                [x.to_list() for x in scanned_variables],
+                "Select Variable",
+                [["Origin", 4], ["Function name", 25], ["Variable name", 25], ["Expression address", 10]]
+            )
+            row = variable_chooser.Show(modal=True)
+            if row != -1:
+                idaapi.open_pseudocode(scanned_variables[row].expression_address, 0)
+
+        # Double click on type. If type is virtual table than opens windows with virtual methods
+        elif index.column() == 1:
+            self.structure.activate_member(index.row())
+
+    # HELPER METHODS #
+
+    @staticmethod
+    def __get_font(item):
+        if isinstance(item, VirtualTable):
+            return QtGui.QFont("Consolas", 10, QtGui.QFont.Bold)
+        if isinstance(item, VoidMember):
+            return QtGui.QFont("Consolas", 10, italic=True)
+
+    def __reset(self):
+        self.modelReset.emit()
@@ -0,0 +1,82 @@
+import logging
+
+import idaapi
+
+from . import cache
+from . import helper
+from .call_graph import call_graph
+from .cfunc_cache import cfunc_cache, internal_decompilation
+from .work_queue import WorkQueue
+import HexRaysPyTools.settings as settings
+
+logger = logging.getLogger(__name__)
+
+
+class TouchPipeline(object):
+    """
+    Before Deep Scan all functions called by the scanned one should be decompiled at least once. This makes IDA
+    recognize their arguments properly, and so the variable can be tracked through calls. Callees are taken from the
+    call graph up to `TOUCH_MAX_DEPTH` levels and decompiled starting from the deepest ones. Touched functions are
+    stored in the database together with the number of levels of their callees touched, so they are not touched
+    again unless a deeper touch is needed.
+    """
+
+    def __init__(self, func_ea, max_depth=None):
+        self.func_ea = func_ea
+        self.max_depth = settings.TOUCH_MAX_DEPTH if max_depth is None else max_depth
+
+    def process(self):
+        """ Returns True if function was decompiled again and its view should be refreshed """
+        if self.__is_touched(self.func_ea, self.max_depth):
+            return False
+
+        callees = self.__collect_callees()
+        logger.debug("Touching {} functions called by {}".format(len(callees), helper.to_hex(self.func_ea)))
+
+        with internal_decompilation:
+            queue = WorkQueue("Decompiling called functions", reversed(callees), lambda x: idaapi.get_short_name(x[0]))
+            completed = queue.run(self.__touch)
+            if not completed:
+                logger.info("Touching functions has been cancelled, {} of {} are decompiled".format(
+                    queue.processed, len(callees)))
+
+            # Arguments of callees might have changed, so the function is decompiled again
+            cfunc_cache.invalidate(self.func_ea)
+            cfunc_cache.decompile(self.func_ea)
+        if completed:
+            cache.add_touched_function(self.func_ea, self.max_depth)
+        return True
+
+    @staticmethod
+    def __is_touched(func_ea, depth):
+        return cache.touched_functions.get(func_ea, -1) >= depth
+
+    def __collect_callees(self):
+        """
+        Returns (function, depth) of functions reachable from the starting one in breadth-first order. Functions
+        which have already been touched with enough levels of their callees are skipped together with the callees
+        """
+        result = []
+        visited = {self.func_ea}
+        current_level = [self.func_ea]
+        depth = 0
+        while current_level and depth < self.max_depth:
+            depth += 1
+            next_level = []
+            for func_ea in current_level:
+                for callee_ea in call_graph.get_callees(func_ea):
+                    if callee_ea in visited:
+                        continue
+                    visited.add(callee_ea)
+                    if helper.is_imported_ea(callee_ea) or self.__is_touched(callee_ea, self.max_depth - depth):
+                        continue
+                    result.append((callee_ea, depth))
+                    next_level.append(callee_ea)
+            current_level = next_level
+        return result
+
+    def __touch(self, item):
+        # Deeper functions are touched first, so callees of this one are already touched up to the maximal depth
+        func_ea, depth = item
+        helper.decompile_function(func_ea)
+        cache.add_touched_function(func_ea, self.max_depth - depth)
@@ -1,10 +1,24 @@
+import collections
 import ctypes
+import logging
+import struct
 import sys
+import time
 
 import idaapi
 
 from . import const
-import HexRaysPyTools.forms as forms
+
+logger = logging.getLogger(__name__)
+
+# Sizes of types from imported libraries are stored in database, netnode name is followed by library name
+TYPE_SIZES_NODE_PREFIX = "$HexRaysPyTools:TypeSizes:"
+
+# {library name: {size: [ordinals]}}
+_type_sizes = {}
+
+# {library name: ContainmentIndex}
+_containment_indices = {}
 
 
 class til_t(ctypes.Structure):
@@ -46,6 +60,7 @@ def choose_til():
         type_library = idaapi.cvar.idati.base(idx)          # type: idaapi.til_t
         list_type_library.append((type_library, type_library.name, type_library.desc))
 
+    import HexRaysPyTools.forms as forms
     library_chooser = forms.MyChoose(
         list([[x[1], x[2]] for x in list_type_library]),
         "Select Library",
@@ -69,3 +84,190 @@ def import_type(library, name):
         type_id = idaapi.import_type(library, -1, name)  # tid_t
         if type_id != idaapi.BADORD:
             return last_ordinal
+
+
+def get_ordinals_by_size(library, max_ordinal, size):
+    """ Returns ordinals of all types in the library having given size """
+    sizes = _type_sizes.get(library.name)
+    if sizes is None:
+        is_local_types = library.name == idaapi.cvar.idati.name
+        # Local Types change all the time, so only sizes of types from imported libraries are saved
+        sizes = None if is_local_types else _load_type_sizes(library, max_ordinal)
+        if sizes is None:
+            sizes = _calculate_type_sizes(library, max_ordinal)
+            if not is_local_types:
+                _save_type_sizes(library, max_ordinal, sizes)
+        _type_sizes[library.name] = sizes
+    return sizes.get(size, [])
+
+
+def find_containing_types(library, tinfo):
+    """
+    Returns sorted list of (parent ordinal, offset, member path, parent name, parent size) of all places where the type
+    is embedded in types of the library
+    """
+    index = _containment_indices.get(library.name)
+    if index is None:
+        index = ContainmentIndex(library)
+        _containment_indices[library.name] = index
+    return index.find(tinfo)
+
+
+def invalidate_local_types():
+    _type_sizes.pop(idaapi.cvar.idati.name, None)
+    index = _containment_indices.get(idaapi.cvar.idati.name)
+    if index:
+        index.invalidate()
+
+
+def clear_indices():
+    _type_sizes.clear()
+    _containment_indices.clear()
+
+
+def _get_type_key(tinfo):
+    # Typedefs are resolved, so LIST_ENTRY and _LIST_ENTRY are the same. Anonymous types don't have key
+    return tinfo.get_final_type_name() or None
+
+
+class ContainmentIndex(object):
+    """
+    Reverse index from name of a structure to all places where it's embedded in types of the library, including
+    nested members: {type name: [(parent ordinal, offset, member path)]}. When library changes, only changed types
+    and types embedding them are walked again.
+    """
+
+    def __init__(self, library):
+        self.__library = library
+        self.__entries = collections.defaultdict(list)
+        self.__serialized = {}      # {ordinal: raw type information}, used to find changed types
+        self.__type_info = {}       # {ordinal: (type key, name, size)}
+        self.__dirty = True
+
+    def invalidate(self):
+        self.__dirty = True
+
+    def find(self, tinfo):
+        if self.__dirty:
+            self.__refresh()
+        key = _get_type_key(tinfo)
+        if not key:
+            return []
+        return [
+            (ordinal, offset, path) + self.__type_info[ordinal][1:]
+            for ordinal, offset, path in sorted(self.__entries.get(key, []))
+        ]
+
+    def __refresh(self):
+        t = time.time()
+        max_ordinal = idaapi.get_ordinal_qty(self.__library)
+        changed = set(ordinal for ordinal in self.__serialized if ordinal >= max_ordinal)
+        for ordinal in changed:
+            del self.__serialized[ordinal]
+        for ordinal in range(1, max_ordinal):
+            serialized = idaapi.get_numbered_type(self.__library, ordinal)
+            if self.__serialized.get(ordinal) != serialized:
+                self.__serialized[ordinal] = serialized
+                changed.add(ordinal)
+
+        # Offsets of members nested in changed types could move, so all types embedding them must be walked again.
+        # Parents can embed a changed type by its old name as well as by the new one, e.g. when a forward declared
+        # structure gets defined or a type is renamed to the name used by other types
+        tinfo = idaapi.tinfo_t()
+        pending = set()
+        for ordinal in changed:
+            pending.add(self.__type_info.get(ordinal, (None, ))[0])
+            if ordinal in self.__serialized and tinfo.create_typedef(self.__library, ordinal):
+                pending.add(_get_type_key(tinfo))
+        pending.discard(None)
+        visited_keys = set(pending)
+        affected = set(changed)
+        while pending:
+            for parent_ordinal, _, _ in self.__entries.get(pending.pop(), ()):
+                if parent_ordinal not in affected:
+                    affected.add(parent_ordinal)
+                    key = self.__type_info.get(parent_ordinal, (None, ))[0]
+                    if key and key not in visited_keys:
+                        visited_keys.add(key)
+                        pending.add(key)
+
+        if len(affected) < len(self.__type_info):
+            for key in list(self.__entries):
+                entries = [x for x in self.__entries[key] if x[0] not in affected]
+                if entries:
+                    self.__entries[key] = entries
+                else:
+                    del self.__entries[key]
+        else:
+            self.__entries.clear()
+
+        members_cache = {}
+        for ordinal in affected:
+            self.__type_info.pop(ordinal, None)
+            if ordinal not in self.__serialized or not tinfo.create_typedef(self.__library, ordinal):
+                continue
+            self.__type_info[ordinal] = (_get_type_key(tinfo), tinfo.dstr(), tinfo.get_size())
+            if tinfo.is_udt():
+                for key, offset, path in self.__get_members(tinfo, members_cache):
+                    if key:
+                        self.__entries[key].append((ordinal, offset, path))
+
+        self.__dirty = False
+        logger.debug("Containment index of {} updated for {} types in {:.3f} seconds".format(
+            self.__library.name, len(affected), time.time() - t))
+
+    def __get_members(self, tinfo, members_cache):
+        """ Returns (type key, offset, path) of all members of the structure including nested ones """
+        key = _get_type_key(tinfo)
+        if key in members_cache:
+            return members_cache[key]
+
+        result = []
+        udt_data = idaapi.udt_type_data_t()
+        tinfo.get_udt_details(udt_data)
+        for udt_member in udt_data:
+            offset = udt_member.offset // 8
+            result.append((_get_type_key(udt_member.type), offset, udt_member.name))
+            if udt_member.type.is_udt():
+                for member_key, member_offset, name in self.__get_members(udt_member.type, members_cache):
+                    path = udt_member.name + '.' + name if udt_member.name else name
+                    result.append((member_key, offset + member_offset, path))
+        if key:
+            members_cache[key] = result
+        return result
+
+
+def _calculate_type_sizes(library, max_ordinal):
+    t = time.time()
+    result = collections.defaultdict(list)
+    tinfo = idaapi.tinfo_t()
+    for ordinal in range(1, max_ordinal):
+        if tinfo.get_numbered_type(library, ordinal):
+            size = tinfo.get_size()
+            if size != idaapi.BADSIZE:
+                result[size].append(ordinal)
+    logger.debug("Sizes of {} types from {} calculated in {:.3f} seconds".format(
+        max_ordinal - 1, library.name, time.time() - t))
+    return result
+
+
+def _load_type_sizes(library, max_ordinal):
+    """ Returns saved sizes or None if they are absent or library has changed since they were saved """
+    node = idaapi.netnode(TYPE_SIZES_NODE_PREFIX + library.name, 0, False)
+    if node.index() == idaapi.BADNODE or node.altval(0) != max_ordinal:
+        return None
+    blob = node.getblob(0, 'S') or b""
+    record_size = struct.calcsize("<IQ")
+    result = collections.defaultdict(list)
+    for position in range(0, len(blob) - record_size + 1, record_size):
+        ordinal, size = struct.unpack_from("<IQ", blob, position)
+        result[size].append(ordinal)
+    return result
+
+
+def _save_type_sizes(library, max_ordinal, sizes):
+    node = idaapi.netnode(TYPE_SIZES_NODE_PREFIX + library.name, 0, True)
+    blob = b"".join(
+        struct.pack("<IQ", ordinal, size) for size, ordinals in sizes.items() for ordinal in ordinals)
+    node.setblob(blob, 0, 'S')
+    node.altset(0, max_ordinal)
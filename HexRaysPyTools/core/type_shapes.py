@@ -0,0 +1,145 @@
+import collections
+import logging
+import time
+
+import idaapi
+
+from . import const
+
+logger = logging.getLogger(__name__)
+
+# Signature of pointer to a structure which first member is a function pointer, used for virtual tables
+VTABLE_SIGNATURE = "<vtable>"
+
+
+class TypeShape(object):
+    """
+    Flattened layout of a structure or union: signatures of all fields including nested structures. Elements of arrays
+    are kept as ranges, so big arrays don't take space. The same fields as in `helper.get_fields_at_offset` are stored.
+    Signature is the size of the field, it doesn't depend on typedefs, so the shape only narrows down candidates and
+    types must be compared afterwards.
+    """
+
+    def __init__(self, tinfo):
+        self.size = tinfo.get_size()
+        self.fields = collections.defaultdict(set)     # {offset: set(signatures)}
+        self.arrays = []                                # [(start, end, element size, element signature)]
+        self.__add_udt(tinfo, 0)
+
+    def get_signatures(self, offset):
+        result = set(self.fields.get(offset, ()))
+        for start, end, element_size, signature in self.arrays:
+            if start <= offset < end and (offset - start) % element_size == 0:
+                result.add(signature)
+        return result
+
+    def matches(self, requirements):
+        """ requirements - {offset: set(signatures)}, None signature matches any field """
+        for offset, signatures in requirements.items():
+            present = self.get_signatures(offset)
+            if not [x for x in signatures if (x is None and present) or x in present]:
+                return False
+        return True
+
+    def __add_udt(self, tinfo, base):
+        self.fields[base].add(tinfo.get_size())
+        udt_data = idaapi.udt_type_data_t()
+        if not tinfo.get_udt_details(udt_data):
+            return
+        for udt_member in udt_data:
+            if udt_member.offset % 8:
+                continue
+            offset = base + udt_member.offset // 8
+            member_type = udt_member.type
+            if member_type.is_ptr():
+                self.fields[offset].add(const.EA_SIZE)
+                if self.__is_vtable_pointer(member_type):
+                    self.fields[offset].add(VTABLE_SIGNATURE)
+            elif not member_type.is_udt():
+                self.fields[offset].add(member_type.get_size())
+
+            if member_type.is_array():
+                element_size = member_type.get_array_element().get_size()
+                if element_size and element_size != idaapi.BADSIZE:
+                    self.arrays.append((offset, offset + member_type.get_size(), element_size, element_size))
+            elif member_type.is_udt():
+                self.__add_udt(member_type, offset)
+
+    @staticmethod
+    def __is_vtable_pointer(tinfo):
+        udt_data = idaapi.udt_type_data_t()
+        return tinfo.get_pointed_object().get_udt_details(udt_data) and udt_data.size() > 0 and \
+            udt_data[0].type.is_funcptr()
+
+
+class TypeShapeIndex(object):
+    """
+    Shapes of all structures from Local Types with reverse index from (offset, signature) to ordinals. It's built on
+    the first request and dropped every time Local Types are changed.
+    """
+
+    def __init__(self):
+        self.__shapes = None                # {ordinal: TypeShape}
+        self.__field_ordinals = None        # {(offset, signature): set(ordinals)}
+        self.__offset_ordinals = None       # {offset: set(ordinals)}
+        self.__array_ordinals = None        # ordinals of structures having arrays
+
+    def invalidate(self):
+        self.__shapes = None
+        self.__field_ordinals = None
+        self.__offset_ordinals = None
+        self.__array_ordinals = None
+
+    def find(self, requirements, min_size=0):
+        """
+        Returns sorted ordinals of structures that have at every given offset field with one of the signatures.
+
+        :param requirements: {offset: set(signatures)}, None signature matches any field at the offset
+        :param min_size: minimal size of the structure
+        """
+        if self.__shapes is None:
+            self.__build()
+
+        candidates = None
+        for offset, signatures in requirements.items():
+            matched = set(self.__array_ordinals)    # Arrays are checked later, offsets of their elements aren't indexed
+            for signature in signatures:
+                if signature is None:
+                    matched |= self.__offset_ordinals.get(offset, set())
+                else:
+                    matched |= self.__field_ordinals.get((offset, signature), set())
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return []
+
+        if candidates is None:
+            candidates = set(self.__shapes)
+        return sorted(
+            ordinal for ordinal in candidates
+            if self.__shapes[ordinal].size >= min_size and
+            (ordinal not in self.__array_ordinals or self.__shapes[ordinal].matches(requirements))
+        )
+
+    def __build(self):
+        t = time.time()
+        self.__shapes = {}
+        self.__field_ordinals = collections.defaultdict(set)
+        self.__offset_ordinals = collections.defaultdict(set)
+        self.__array_ordinals = set()
+
+        tinfo = idaapi.tinfo_t()
+        for ordinal in range(1, idaapi.get_ordinal_qty(idaapi.cvar.idati)):
+            if not tinfo.get_numbered_type(idaapi.cvar.idati, ordinal) or not tinfo.is_udt():
+                continue
+            shape = TypeShape(tinfo)
+            self.__shapes[ordinal] = shape
+            for offset, signatures in shape.fields.items():
+                self.__offset_ordinals[offset].add(ordinal)
+                for signature in signatures:
+                    self.__field_ordinals[(offset, signature)].add(ordinal)
+            if shape.arrays:
+                self.__array_ordinals.add(ordinal)
+        logger.debug("Shapes of {} structures indexed in {:.3f} seconds".format(len(self.__shapes), time.time() - t))
+
+
+type_shape_index = TypeShapeIndex()
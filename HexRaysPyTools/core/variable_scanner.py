@@ -1,9 +1,13 @@
+import copy
 import logging
+import weakref
 import idaapi
 import idc
 from . import const
 from . import helper
 from . import temporary_structure
+from .call_graph import call_graph
+from .scan_summaries import ScanSummary, scan_summaries
 import HexRaysPyTools.api as api
 
 logger = logging.getLogger(__name__)
@@ -15,8 +19,20 @@ SETTING_SCAN_ALL_ARGUMENTS = True
 scanned_functions = set()
 debug_scan_tree = []
 
+# The same variable found by several scans is shared by members of all structures. Objects are dropped from here as
+# soon as no member refers to them
+_scanned_objects = weakref.WeakValueDictionary()
+
+
+def _intern_scanned_object(scanned_object):
+    key = (type(scanned_object), scanned_object.func_ea, scanned_object.name, scanned_object.expression_address,
+           scanned_object.origin, scanned_object._applicable)
+    return _scanned_objects.setdefault(key, scanned_object)
+
 
 class ScannedObject(object):
+    __slots__ = ('name', 'expression_address', 'func_ea', 'origin', '_applicable', '__weakref__')
+
     def __init__(self, name, expression_address, origin, applicable=True):
         """
         :param name: Object name
@@ -40,15 +56,17 @@ class ScannedObject(object):
 
     @staticmethod
     def create(obj, expression_address, origin, applicable):
-        """ Creates suitable instance of ScannedObject depending on obj """
+        """ Creates suitable instance of ScannedObject depending on obj or returns already existing equal one """
         if obj.id == api.SO_GLOBAL_OBJECT:
-            return ScannedGlobalObject(obj.ea, obj.name, expression_address, origin, applicable)
+            scanned_object = ScannedGlobalObject(obj.ea, obj.name, expression_address, origin, applicable)
         elif obj.id == api.SO_LOCAL_VARIABLE:
-            return ScannedVariableObject(obj.lvar, obj.name, expression_address, origin, applicable)
+            scanned_object = ScannedVariableObject(obj.lvar, obj.name, expression_address, origin, applicable)
         elif obj.id in (api.SO_STRUCT_REFERENCE, api.SO_STRUCT_POINTER):
-            return ScannedStructureMemberObject(obj.struct_name, obj.offset, expression_address, origin, applicable)
+            scanned_object = ScannedStructureMemberObject(
+                obj.struct_name, obj.offset, expression_address, origin, applicable)
         else:
             raise AssertionError
+        return _intern_scanned_object(scanned_object)
 
     def to_list(self):
         """ Creates list that is acceptable to MyChoose2 viewer """
@@ -71,6 +89,8 @@ class ScannedObject(object):
 
 
 class ScannedGlobalObject(ScannedObject):
+    __slots__ = ('__obj_ea',)
+
     def __init__(self, obj_ea, name, expression_address, origin, applicable=True):
         super(ScannedGlobalObject, self).__init__(name, expression_address, origin, applicable)
         self.__obj_ea = obj_ea
@@ -81,6 +101,8 @@ class ScannedGlobalObject(ScannedObject):
 
 
 class ScannedVariableObject(ScannedObject):
+    __slots__ = ('__lvar',)
+
     def __init__(self, lvar, name, expression_address, origin, applicable=True):
         super(ScannedVariableObject, self).__init__(name, expression_address, origin, applicable)
         self.__lvar = idaapi.lvar_locator_t(lvar.location, lvar.defea)
@@ -103,6 +125,8 @@ class ScannedVariableObject(ScannedObject):
 
 
 class ScannedStructureMemberObject(ScannedObject):
+    __slots__ = ('__struct_name', '__struct_offset')
+
     def __init__(self, struct_name, struct_offset, name, expression_address, origin, applicable=True):
         super(ScannedStructureMemberObject, self).__init__(name, expression_address, origin, applicable)
         self.__struct_name = struct_name
@@ -120,6 +144,15 @@ class SearchVisitor(api.ObjectVisitor):
         self.__origin = origin
         self.__temporary_structure = temporary_structure
 
+    @property
+    def origin(self):
+        return self.__origin
+
+    def process(self):
+        # Structure Builder is refreshed once when scanning is finished rather than after every found member
+        with self.__temporary_structure.bulk_update():
+            super(SearchVisitor, self).process()
+
     def _manipulate(self, cexpr, obj):
         super(SearchVisitor, self)._manipulate(cexpr, obj)
 
@@ -134,7 +167,10 @@ class SearchVisitor(api.ObjectVisitor):
         if member:
             logger.debug("\tCreating member with type {}, {}, offset - {}".format(
                 member.type_name, member.scanned_variables, member.offset))
-            self.__temporary_structure.add_row(member)
+            self._add_member(member)
+
+    def _add_member(self, member):
+        self.__temporary_structure.add_row(member)
 
     def _get_member(self, offset, cexpr, obj, tinfo=None, obj_ea=None):
         cexpr_ea = helper.find_asm_address(cexpr, self.parents)
@@ -301,15 +337,75 @@ class NewShallowSearchVisitor(SearchVisitor, api.ObjectDownwardsVisitor):
         super(NewShallowSearchVisitor, self).__init__(cfunc, origin, obj, temporary_structure)
 
 
+class MemberRecipe(object):
+    """ Everything needed to create the same member at another origin """
+    __slots__ = ('offset', 'scanned_variable', 'address', 'tinfo', 'member_class')
+
+    def __init__(self, member):
+        self.offset = member.offset - member.origin
+        self.scanned_variable = next(iter(member.scanned_variables), None)
+        if isinstance(member, temporary_structure.VirtualTable):
+            self.address = member.address
+        else:
+            # Member's tinfo is interned and never changed in place
+            self.tinfo = member.tinfo
+        self.member_class = type(member)
+
+    def create(self, origin):
+        scanned_variable = self.scanned_variable
+        if scanned_variable and scanned_variable.origin != origin:
+            scanned_variable = copy.copy(scanned_variable)
+            scanned_variable.origin = origin
+            scanned_variable = _intern_scanned_object(scanned_variable)
+        if self.member_class is temporary_structure.VirtualTable:
+            return temporary_structure.VirtualTable(self.offset, self.address, scanned_variable, origin)
+        if self.member_class is temporary_structure.VoidMember:
+            return temporary_structure.VoidMember(self.offset, scanned_variable, origin)
+        return temporary_structure.Member(self.offset, self.tinfo, scanned_variable, origin)
+
+
 class NewDeepSearchVisitor(SearchVisitor, api.RecursiveObjectDownwardsVisitor):
+    """
+    Functions reached by scanning their argument are summarized, so next scan reaching the same function with any
+    origin replays the summary instead of visiting ctree again
+    """
+
     def __init__(self, cfunc, origin, obj, temporary_structure):
         super(NewDeepSearchVisitor, self).__init__(cfunc, origin, obj, temporary_structure)
+        self.__summary = None
+
+    def _visit_new(self, func_ea, arg_idx):
+        summary = scan_summaries.get(func_ea, arg_idx)
+        if summary:
+            logger.debug("Replaying summary of {} (idx: {})".format(helper.to_hex(func_ea), arg_idx))
+            for recipe in summary.members:
+                self._add_member(recipe.create(self.origin))
+            for callee_ea, callee_arg_idx in summary.calls:
+                self._add_visit(callee_ea, callee_arg_idx)
+            return
+
+        self.__summary = ScanSummary()
+        try:
+            super(NewDeepSearchVisitor, self)._visit_new(func_ea, arg_idx)
+            scan_summaries.add(func_ea, arg_idx, self.__summary)
+        finally:
+            self.__summary = None
+
+    def _add_member(self, member):
+        if self.__summary is not None:
+            self.__summary.members.append(MemberRecipe(member))
+        super(NewDeepSearchVisitor, self)._add_member(member)
+
+    def _add_visit(self, func_ea, arg_idx):
+        if self.__summary is not None:
+            self.__summary.calls.append((func_ea, arg_idx))
+        return super(NewDeepSearchVisitor, self)._add_visit(func_ea, arg_idx)
 
 
 class DeepReturnVisitor(NewDeepSearchVisitor):
     def __init__(self, cfunc, origin, obj, temporary_structure):
         super(DeepReturnVisitor, self).__init__(cfunc, origin, obj, temporary_structure)
-        self.__callers_ea = helper.get_funcs_calling_address(cfunc.entry_ea)
+        self.__callers_ea = call_graph.get_callers(cfunc.entry_ea)
         self.__call_obj = obj
 
     def _start(self):
@@ -0,0 +1,58 @@
+import collections
+import time
+
+import idaapi
+
+# How often the text of the wait box is updated, seconds
+PROGRESS_UPDATE_INTERVAL = 0.2
+
+
+class WorkQueue(object):
+    """
+    Processes items one at a time under IDA wait box. Checking for cancellation between the items lets IDA handle UI
+    events, so the user sees the progress and can stop long operations. Items can be added while queue is running.
+    """
+
+    def __init__(self, title, items=(), describe=str):
+        """
+        :param title: text shown in the wait box
+        :param items: initial items
+        :param describe: function returning short description of the item for the progress message
+        """
+        self.title = title
+        self.processed = 0
+        self.cancelled = False
+        self.__items = collections.deque(items)
+        self.__describe = describe
+
+    def push(self, item):
+        self.__items.append(item)
+
+    def run(self, process):
+        """
+        Calls `process` for every item in the queue.
+
+        :param process: function accepting an item. If it returns False, processing stops
+        :return: True if all items were processed
+        """
+        last_update = 0
+        idaapi.show_wait_box(self.title)
+        try:
+            while self.__items:
+                if idaapi.user_cancelled():
+                    self.cancelled = True
+                    return False
+                item = self.__items.popleft()
+                if time.time() - last_update > PROGRESS_UPDATE_INTERVAL:
+                    last_update = time.time()
+                    idaapi.replace_wait_box("{}\n{}/{}: {}".format(
+                        self.title, self.processed + 1, self.processed + len(self.__items) + 1, self.__describe(item)))
+                if process(item) is False:
+                    return False
+                self.processed += 1
+        finally:
+            idaapi.hide_wait_box()
+        return True
+
+    def __len__(self):
+        return len(self.__items)
@@ -18,11 +18,47 @@ class MyChoose(idaapi.Choose):
         return len(self.items)
 
 
+class VirtualTableChoose(MyChoose):
+    def __init__(self, items, temp_struct, virtual_table):
+        MyChoose.__init__(
+            self,
+            items,
+            "Select Virtual Function",
+            [["Address", 10], ["Name", 15], ["Declaration", 45]],
+            13
+        )
+        self.popup_names = ["Scan All", "-", "Scan", "-"]
+        self.__temp_struct = temp_struct
+        self.__virtual_table = virtual_table
+
+    def OnGetLineAttr(self, n):
+        return [0xd9d9d9, 0x0] if self.__virtual_table.virtual_functions[n].visited else [0xffffff, 0x0]
+
+    def OnGetIcon(self, n):
+        return 32 if self.__virtual_table.virtual_functions[n].visited else 160
+
+    def OnInsertLine(self):
+        """ Scan All Functions menu """
+        self.__virtual_table.scan_virtual_functions(self.__temp_struct)
+
+    def OnEditLine(self, n):
+        """ Scan menu """
+        self.__virtual_table.scan_virtual_function(n, self.__temp_struct)
+
+
 class StructureBuilder(idaapi.PluginForm):
-    def __init__(self, structure_model):
+    def __init__(self, structure_registry, get_model):
+        """
+        :param structure_registry: StructureRegistry, its active structure is shown
+        :param get_model: function returning TemporaryStructureModel for the structure with given name
+        """
         super(StructureBuilder, self).__init__()
-        self.structure_model = structure_model
+        self.structure_registry = structure_registry
+        self.get_model = get_model
+        self.structure_model = get_model(structure_registry.active_name)
         self.parent = None
+        self.struct_view = None
+        self.structure_combo = None
 
     def OnCreate(self, form):
         self.parent = idaapi.PluginForm.FormToPyQtWidget(form)
@@ -50,6 +86,10 @@ class StructureBuilder(idaapi.PluginForm):
         btn_clear = QtWidgets.QPushButton("Clear")  # Clear button doesn't have shortcut because it can fuck up all work
         btn_recognize = QtWidgets.QPushButton("Recognize Shape")
         btn_recognize.setStyleSheet("QPushButton {width: 100px; height: 20px;}")
+        btn_new = QtWidgets.QPushButton("New")
+        btn_delete = QtWidgets.QPushButton("Delete")
+        self.structure_combo = QtWidgets.QComboBox()
+        self.structure_combo.setSizeAdjustPolicy(QtWidgets.QComboBox.AdjustToContents)
 
         btn_finalize.setShortcut("f")
         btn_disable.setShortcut("d")
@@ -61,6 +101,7 @@ class StructureBuilder(idaapi.PluginForm):
         btn_remove.setShortcut("r")
 
         struct_view = QtWidgets.QTableView()
+        self.struct_view = struct_view
         struct_view.setModel(self.structure_model)
         # struct_view.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
 
@@ -85,7 +126,14 @@ class StructureBuilder(idaapi.PluginForm):
         grid_box.addWidget(btn_recognize, 0, 6)
         grid_box.addWidget(btn_clear, 1, 6)
 
+        structures_box = QtWidgets.QHBoxLayout()
+        structures_box.addWidget(self.structure_combo)
+        structures_box.addWidget(btn_new)
+        structures_box.addWidget(btn_delete)
+        structures_box.addStretch()
+
         vertical_box = QtWidgets.QVBoxLayout()
+        vertical_box.addLayout(structures_box)
         vertical_box.addWidget(struct_view)
         vertical_box.addLayout(grid_box)
         self.parent.setLayout(vertical_box)
@@ -101,11 +149,41 @@ class StructureBuilder(idaapi.PluginForm):
         btn_resolve.clicked.connect(lambda: self.structure_model.resolve_types())
         btn_clear.clicked.connect(lambda: self.structure_model.clear())
         btn_recognize.clicked.connect(lambda: self.structure_model.recognize_shape(struct_view.selectedIndexes()))
-        struct_view.activated[QtCore.QModelIndex].connect(self.structure_model.activated)
+        btn_new.clicked.connect(self.create_structure)
+        btn_delete.clicked.connect(self.delete_structure)
+        struct_view.activated[QtCore.QModelIndex].connect(lambda index: self.structure_model.activated(index))
         self.structure_model.dataChanged.connect(struct_view.clearSelection)
 
+        self.update_structures()
+        self.structure_combo.activated[int].connect(
+            lambda idx: self.structure_registry.select(self.structure_combo.itemText(idx)))
+        self.structure_registry.add_listener(self.update_structures)
+
+    def update_structures(self):
+        """ Called when structures are added, removed or another one is activated """
+        self.structure_combo.clear()
+        self.structure_combo.addItems(self.structure_registry.names())
+        self.structure_combo.setCurrentIndex(self.structure_combo.findText(self.structure_registry.active_name))
+        model = self.get_model(self.structure_registry.active_name)
+        if model is not self.structure_model:
+            self.structure_model.dataChanged.disconnect(self.struct_view.clearSelection)
+            self.structure_model = model
+            self.struct_view.setModel(model)
+            model.dataChanged.connect(self.struct_view.clearSelection)
+
+    def create_structure(self):
+        name = idaapi.ask_str("", 0, "Enter name of new structure:")
+        if name:
+            self.structure_registry.add(name)
+
+    def delete_structure(self):
+        name = self.structure_registry.active_name
+        answer = idaapi.ask_yn(idaapi.ASKBTN_NO, "Delete structure {} with all its members?".format(name))
+        if answer == idaapi.ASKBTN_YES:
+            self.structure_registry.remove(name)
+
     def OnClose(self, form):
-        pass
+        self.structure_registry.remove_listener(self.update_structures)
 
     def Show(self, caption=None, options=0):
         return idaapi.PluginForm.Show(self, caption, options=options)
@@ -19,6 +19,26 @@ STORE_XREFS = True
 # Full list can be found in `Const.LEGAL_TYPES`.
 # But if set this option to True than variable of every type could be possible to scan
 SCAN_ANY_TYPE = False
+# Maximal number of decompiled functions kept in memory by the plugin and their approximate total size in megabytes
+CFUNC_CACHE_SIZE = 1024
+CFUNC_CACHE_MEMORY = 512
+# How deep in the call graph functions are decompiled before Deep Scan
+TOUCH_MAX_DEPTH = 10
+# Number of functions after which collected xrefs are written to database while building struct xref index
+XREF_INDEX_CHECKPOINT = 100
+# Collect xrefs from functions decompiled by the plugin itself during Deep Scan. They are collected once after scan
+COLLECT_INTERNAL_XREFS = True
+# Limits of Deep Scan: how many calls away from the scanned function it goes, how many functions it visits and how
+# many seconds it takes. Zero means no limit
+SCAN_MAX_DEPTH = 32
+SCAN_MAX_FUNCTIONS = 2000
+SCAN_TIME_LIMIT = 300
+# Argument of a function or virtual table shared by more seeds than this doesn't merge their inferred structures, it's
+# likely a generic helper like memset wrapper or a virtual table of a base class overwritten by derived constructors
+INFER_MAX_SEEDS_PER_LINK = 32
+# Hooks run on every decompilation: CONTAINING_RECORD recognition and untangling of `if` statements
+NEGATIVE_OFFSETS = True
+UNTANGLE_IF_STATEMENTS = True
 
 
 def add_default_settings(config):
@@ -35,6 +55,39 @@ def add_default_settings(config):
     if not config.has_option("DEFAULT", "SCAN_ANY_TYPE"):
         config.set(None, 'SCAN_ANY_TYPE', str(SCAN_ANY_TYPE))
         updated = True
+    if not config.has_option("DEFAULT", "CFUNC_CACHE_SIZE"):
+        config.set(None, 'CFUNC_CACHE_SIZE', str(CFUNC_CACHE_SIZE))
+        updated = True
+    if not config.has_option("DEFAULT", "CFUNC_CACHE_MEMORY"):
+        config.set(None, 'CFUNC_CACHE_MEMORY', str(CFUNC_CACHE_MEMORY))
+        updated = True
+    if not config.has_option("DEFAULT", "TOUCH_MAX_DEPTH"):
+        config.set(None, 'TOUCH_MAX_DEPTH', str(TOUCH_MAX_DEPTH))
+        updated = True
+    if not config.has_option("DEFAULT", "XREF_INDEX_CHECKPOINT"):
+        config.set(None, 'XREF_INDEX_CHECKPOINT', str(XREF_INDEX_CHECKPOINT))
+        updated = True
+    if not config.has_option("DEFAULT", "COLLECT_INTERNAL_XREFS"):
+        config.set(None, 'COLLECT_INTERNAL_XREFS', str(COLLECT_INTERNAL_XREFS))
+        updated = True
+    if not config.has_option("DEFAULT", "SCAN_MAX_DEPTH"):
+        config.set(None, 'SCAN_MAX_DEPTH', str(SCAN_MAX_DEPTH))
+        updated = True
+    if not config.has_option("DEFAULT", "SCAN_MAX_FUNCTIONS"):
+        config.set(None, 'SCAN_MAX_FUNCTIONS', str(SCAN_MAX_FUNCTIONS))
+        updated = True
+    if not config.has_option("DEFAULT", "SCAN_TIME_LIMIT"):
+        config.set(None, 'SCAN_TIME_LIMIT', str(SCAN_TIME_LIMIT))
+        updated = True
+    if not config.has_option("DEFAULT", "INFER_MAX_SEEDS_PER_LINK"):
+        config.set(None, 'INFER_MAX_SEEDS_PER_LINK', str(INFER_MAX_SEEDS_PER_LINK))
+        updated = True
+    if not config.has_option("DEFAULT", "NEGATIVE_OFFSETS"):
+        config.set(None, 'NEGATIVE_OFFSETS', str(NEGATIVE_OFFSETS))
+        updated = True
+    if not config.has_option("DEFAULT", "UNTANGLE_IF_STATEMENTS"):
+        config.set(None, 'UNTANGLE_IF_STATEMENTS', str(UNTANGLE_IF_STATEMENTS))
+        updated = True
 
     if updated:
         try:
@@ -46,7 +99,9 @@ def add_default_settings(config):
 
 
 def load_settings():
-    global DEBUG_MESSAGE_LEVEL, PROPAGATE_THROUGH_ALL_NAMES, STORE_XREFS, SCAN_ANY_TYPE
+    global DEBUG_MESSAGE_LEVEL, PROPAGATE_THROUGH_ALL_NAMES, STORE_XREFS, SCAN_ANY_TYPE, CFUNC_CACHE_SIZE, \
+        CFUNC_CACHE_MEMORY, TOUCH_MAX_DEPTH, XREF_INDEX_CHECKPOINT, COLLECT_INTERNAL_XREFS, SCAN_MAX_DEPTH, \
+        SCAN_MAX_FUNCTIONS, SCAN_TIME_LIMIT, INFER_MAX_SEEDS_PER_LINK, NEGATIVE_OFFSETS, UNTANGLE_IF_STATEMENTS
 
     config = configparser.ConfigParser()
     if os.path.isfile(CONFIG_FILE_PATH):
@@ -58,3 +113,14 @@ def load_settings():
     PROPAGATE_THROUGH_ALL_NAMES = config.getboolean("DEFAULT", 'PROPAGATE_THROUGH_ALL_NAMES')
     STORE_XREFS = config.getboolean("DEFAULT", 'STORE_XREFS')
     SCAN_ANY_TYPE = config.getboolean("DEFAULT", 'SCAN_ANY_TYPE')
+    CFUNC_CACHE_SIZE = config.getint("DEFAULT", 'CFUNC_CACHE_SIZE')
+    CFUNC_CACHE_MEMORY = config.getint("DEFAULT", 'CFUNC_CACHE_MEMORY')
+    TOUCH_MAX_DEPTH = config.getint("DEFAULT", 'TOUCH_MAX_DEPTH')
+    XREF_INDEX_CHECKPOINT = config.getint("DEFAULT", 'XREF_INDEX_CHECKPOINT')
+    COLLECT_INTERNAL_XREFS = config.getboolean("DEFAULT", 'COLLECT_INTERNAL_XREFS')
+    SCAN_MAX_DEPTH = config.getint("DEFAULT", 'SCAN_MAX_DEPTH')
+    SCAN_MAX_FUNCTIONS = config.getint("DEFAULT", 'SCAN_MAX_FUNCTIONS')
+    SCAN_TIME_LIMIT = config.getint("DEFAULT", 'SCAN_TIME_LIMIT')
+    INFER_MAX_SEEDS_PER_LINK = config.getint("DEFAULT", 'INFER_MAX_SEEDS_PER_LINK')
+    NEGATIVE_OFFSETS = config.getboolean("DEFAULT", 'NEGATIVE_OFFSETS')
+    UNTANGLE_IF_STATEMENTS = config.getboolean("DEFAULT", 'UNTANGLE_IF_STATEMENTS')
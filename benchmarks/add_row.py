@@ -0,0 +1,51 @@
+"""
+Measures how fast members are added to a structure. Run inside IDA with any database opened and the plugin installed
+(File -> Script file...). To compare revisions, run it with each of them installed.
+
+Adds MEMBERS_COUNT members one by one with `add_row` and then all at once with `add_rows`. Members are spread over
+fewer offsets than their number and over a few types, so part of them are duplicates as after Deep Scan.
+"""
+import time
+
+import idaapi
+
+import HexRaysPyTools.core.const as const
+from HexRaysPyTools.core.temporary_structure import Member, TemporaryStructure
+
+MEMBERS_COUNT = 10000
+OFFSETS_COUNT = 2500
+TYPE_NAMES = ["int", "char *", "void *", "unsigned __int16", "__int64", "int (__fastcall *)(void *, int)"]
+
+
+def _create_members():
+    types = []
+    for type_name in TYPE_NAMES:
+        tinfo = idaapi.tinfo_t()
+        idaapi.parse_decl(tinfo, idaapi.cvar.idati, type_name + ";", idaapi.PT_SIL)
+        types.append(tinfo)
+    return [Member((idx * 7919 % OFFSETS_COUNT) * 8, types[idx % len(types)], None) for idx in range(MEMBERS_COUNT)]
+
+
+def main():
+    const.init()
+
+    structure = TemporaryStructure()
+    members = _create_members()
+    start = time.time()
+    for member in members:
+        structure.add_row(member)
+    elapsed = time.time() - start
+    print("[Info] add_row: {} members, {} rows, {:.3f} seconds, {:.0f} members per second".format(
+        len(members), len(structure.items), elapsed, len(members) / max(elapsed, 1e-6)))
+
+    structure = TemporaryStructure()
+    members = _create_members()
+    start = time.time()
+    structure.add_rows(members)
+    elapsed = time.time() - start
+    print("[Info] add_rows: {} members, {} rows, {:.3f} seconds, {:.0f} members per second".format(
+        len(members), len(structure.items), elapsed, len(members) / max(elapsed, 1e-6)))
+
+
+if __name__ == "__main__":
+    main()
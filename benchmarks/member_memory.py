@@ -0,0 +1,77 @@
+"""
+Measures memory taken by members of reconstructed structures. Run inside IDA with any database opened and the plugin
+installed (File -> Script file...). To compare revisions, run it with each of them installed. Works with both Python 2
+and Python 3 builds of IDAPython.
+
+Creates MEMBERS_COUNT members spread over a few types, each found through its own scanned variable, like Deep Scan of
+a big class does, and prints the average footprint of a member together with its scanned variable. The footprint is
+the sum of `sys.getsizeof` over every Python object reachable from the members, counting objects shared between them
+once. Type information kept by IDA itself behind tinfo_t isn't counted, only its Python wrapper is.
+"""
+import gc
+import sys
+from types import BuiltinFunctionType, FunctionType, ModuleType
+
+import idaapi
+
+import HexRaysPyTools.api as api
+import HexRaysPyTools.core.const as const
+from HexRaysPyTools.core.temporary_structure import Member, VoidMember
+from HexRaysPyTools.core.variable_scanner import ScannedObject
+
+MEMBERS_COUNT = 100000
+TYPE_NAMES = ["int", "char *", "void *", "unsigned __int16", "__int64"]
+
+# Objects of these types are shared by the whole program, so they don't belong to the members
+_SKIPPED_TYPES = (type, ModuleType, FunctionType, BuiltinFunctionType)
+
+
+def _parse_types():
+    result = []
+    for type_name in TYPE_NAMES:
+        tinfo = idaapi.tinfo_t()
+        idaapi.parse_decl(tinfo, idaapi.cvar.idati, type_name + ";", idaapi.PT_SIL)
+        result.append(tinfo)
+    return result
+
+
+def _create_members(types):
+    obj = api.GlobalVariableObject(idaapi.get_imagebase())
+    obj.name = "benchmark_object"
+    members = []
+    for idx in range(MEMBERS_COUNT):
+        scanned_variable = ScannedObject.create(obj, idaapi.get_imagebase() + idx, 0, False)
+        if idx % (len(types) + 1):
+            # Every member gets its own copy of tinfo as scanner does
+            members.append(Member(idx * 8, idaapi.tinfo_t(types[idx % len(types)]), scanned_variable))
+        else:
+            members.append(VoidMember(idx * 8, scanned_variable))
+    return members
+
+
+def _get_size(roots):
+    """ Returns total size of objects reachable from roots, each object is counted once """
+    seen = set(id(root) for root in roots)
+    stack = list(roots)
+    total = 0
+    while stack:
+        obj = stack.pop()
+        total += sys.getsizeof(obj)
+        for referent in gc.get_referents(obj):
+            if id(referent) not in seen and not isinstance(referent, _SKIPPED_TYPES):
+                seen.add(id(referent))
+                stack.append(referent)
+    return total
+
+
+def main():
+    const.init()
+    types = _parse_types()
+    members = _create_members(types)
+    size = _get_size(members)
+    print("[Info] {} members take {:.1f} KB, {:.1f} bytes per member".format(
+        len(members), size / 1024.0, float(size) / len(members)))
+
+
+if __name__ == "__main__":
+    main()